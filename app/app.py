@@ -1,35 +1,52 @@
 # from bluetooth import send_servo_command
 from wifi import send_servo_command, init_socket
 from controller import Controller
-from processing import process_image
+from calibration import ThresholdCalibrator, SceneProfiles
+from processing import analyze_image, NotebookTracker
+from pipeline import Pipeline
+from telemetry import TelemetryRecorder
+from instrumentation import INSTRUMENTS
+from display import DisplaySink, WindowSink
 # import serial
 import cv2
 import numpy as np
-from typing import Callable
+import queue
+import time
+from typing import Callable, Optional
 
 ESP32_IP = "192.168.2.74"
 ESP32_PORT = 1234
 
-def main(process_frame, camera_index: int = 0, ) -> None:
+def main(process_frame, camera_index: int = 0, report_interval: float = 10.0,
+         sink: Optional[DisplaySink] = None) -> None:
     """
     1. Continuously capture and process frames from the camera.
-    2. Process each frame using the provided callback function.
+    2. Process each frame using the provided callback function, which returns a ProcessResult.
     3. Send servo commands based on the processed frame.
+    Per-stage latency percentiles are printed every report_interval seconds.
+    Frames go to sink (a HighGUI window by default).
     """
 
     # Initialize video capture, controller, socket
     cap = cv2.VideoCapture("new_paper.MOV")
+    sink = sink or WindowSink()
     controller = Controller()
+    telemetry = TelemetryRecorder()
+    INSTRUMENTS.start_reporter(report_interval)
 
     try:
         while True:
+            start = time.perf_counter()
             ret, frame = cap.read()
             if not ret:
                 continue
+            captured = time.perf_counter()
 
             try:
-                # Process frame
-                contour, warped, center, angle = process_frame(frame)
+                # Process frame; the warped view is only computed if something reads it
+                result = process_frame(frame)
+                processed = time.perf_counter()
+                contour, center, angle = result.contour, result.center, result.angle
 
                 # Draw results on frame
                 cv2.drawContours(frame, [contour], -1, (0, 255, 0), 2)
@@ -41,29 +58,140 @@ def main(process_frame, camera_index: int = 0, ) -> None:
                 a1, a2 = controller.get_angle(center)
 
                 # Show warped view alongside main view
-                # cv2.imshow("Warped View", warped)
-
-                # Then we send the servo commands
-                with open("servo_angles.txt", "a") as file:
-                    file.write(f"{a1}, {a2}\n")
+                # cv2.imshow("Warped View", result.warped)
+
+                # Then we send the servo commands, recording them with the frame telemetry
+                sent = time.perf_counter()
+                telemetry.record(center, angle, result.rect, (a1, a2), {
+                    "capture": captured - start,
+                    "process": processed - captured,
+                    "control": sent - processed,
+                })
+                INSTRUMENTS.record("capture", captured - start)
+                INSTRUMENTS.record("control", sent - processed)
+                # From the frame being in hand, not from when we started waiting for it
+                INSTRUMENTS.record("end_to_end", sent - captured)
                 
             except Exception as e:
                 print(f"Frame processing error: {e}")
 
-            cv2.imshow("Tracking (Press 'q' to quit)", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            if not sink.show("Tracking (Press 'q' to quit)", frame):
                 break
     finally:
+        telemetry.close()
         cap.release()
-        cv2.destroyAllWindows()
+        sink.close()
+
+def main_pipelined(process_frame, camera_index: int = 0, report_interval: float = 5.0,
+                   sink: Optional[DisplaySink] = None) -> None:
+    """
+    Pipelined alternative to main(): capture, processing, control and display each run
+    on their own thread, connected by single-slot "latest frame wins" queues.
+    A slow stage drops stale frames instead of stalling capture, so the servo loop
+    always acts on the freshest frame. Per-stage throughput is printed every report_interval seconds.
+    Frames go to sink (a HighGUI window by default).
+    """
+    cap = cv2.VideoCapture("new_paper.MOV")
+    sink = sink or WindowSink()
+    controller = Controller()
+    telemetry = TelemetryRecorder()
+    pipeline = Pipeline()
+    frames = pipeline.queue("frames")
+    results = pipeline.queue("results")
+    display = pipeline.queue("display")
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+
+    def capture():
+        start = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            # End of a video file or a closed device stops the pipeline
+            at_end = frame_count > 0 and cap.get(cv2.CAP_PROP_POS_FRAMES) >= frame_count
+            if at_end or not cap.isOpened():
+                raise StopIteration
+            # A frame that isn't ready yet; back off instead of spinning
+            time.sleep(0.01)
+            return None
+        return frame, start, time.perf_counter()
+
+    def process(item):
+        frame, start, captured = item
+        try:
+            result = process_frame(frame)
+            contour, center, angle = result.contour, result.center, result.angle
+        except Exception as e:
+            print(f"Frame processing error: {e}")
+            display.put(frame)
+            return None
+        processed = time.perf_counter()
+
+        cv2.drawContours(frame, [contour], -1, (0, 255, 0), 2)
+        cv2.circle(frame, center, 10, (0, 0, 255), -1)
+        cv2.putText(frame, f"Angle: {angle:.1f}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        display.put(frame)
+        return result, start, captured, processed
+
+    def control(item):
+        result, start, captured, processed = item
+        a1, a2 = controller.get_angle(result.center)
+        sent = time.perf_counter()
+        telemetry.record(result.center, result.angle, result.rect, (a1, a2), {
+            "capture": captured - start,
+            "process": processed - captured,
+            "control": sent - processed,
+        })
+        # Includes the time frames spend waiting in the stage queues
+        INSTRUMENTS.record("end_to_end", sent - captured)
+        return None
+
+    pipeline.add_stage("capture", capture, outboxes=[frames])
+    pipeline.add_stage("process", process, inbox=frames, outboxes=[results])
+    pipeline.add_stage("control", control, inbox=results)
+    # Display stays on the main thread since HighGUI is not thread safe on every platform
+    display_stats = pipeline.track("display")
+
+    pipeline.start()
+    last_report = time.perf_counter()
+    try:
+        while not pipeline.stop_event.is_set():
+            try:
+                frame = display.get(timeout=0.1)
+            except queue.Empty:
+                frame = None
+
+            if frame is not None:
+                start = time.perf_counter()
+                keep_going = sink.show("Tracking (Press 'q' to quit)", frame)
+                display_stats.record(time.perf_counter() - start)
+            else:
+                # Nothing new while the pipeline is starved, but still pump events and watch for 'q'
+                keep_going = sink.poll()
+            if not keep_going:
+                break
+
+            if time.perf_counter() - last_report >= report_interval:
+                print(pipeline.report(reset=True))
+                print(INSTRUMENTS.format_summary())
+                last_report = time.perf_counter()
+    finally:
+        pipeline.stop()
+        telemetry.close()
+        cap.release()
+        sink.close()
 
 if __name__ == "__main__":
+    tracker = NotebookTracker()
+    # Adapts the white paper threshold to the lighting and remembers it between runs
+    calibrator = ThresholdCalibrator(SceneProfiles("threshold_profiles.json"))
     try:
         main(
-            process_frame=lambda frame: process_image(frame, debug=False)
+            process_frame=calibrator.wrap(lambda frame, threshold: analyze_image(frame, tracker=tracker, threshold=threshold))
         )
     except Exception as e:
         print("Error:", e)
+    finally:
+        calibrator.close()
 
 # SERIAL_PORT = "/dev/cu.ESP32_CAM_BT"
 # BAUD_RATE = 115200
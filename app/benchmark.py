@@ -0,0 +1,173 @@
+"""
+Reproducible, headless benchmark for processing.py.
+
+Renders synthetic scenes (a white quad at a random pose over a textured background, with
+optional noise and clutter) with known ground-truth corners, then reports frames/sec,
+per-function timings, peak memory allocated per frame and detection accuracy.
+
+    python benchmark.py --frames 50 --resolutions 320x240,1920x1080 --json bench.json
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from geometry import quad_metrics_batch
+from processing import analyze_image, preprocess, segment_notebook, transform_perspective
+
+
+def render_scene(width: int, height: int, rng: np.random.Generator, noise: float = 0.0,
+                 clutter: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Render one scene and return (image, corners) where corners is the (4, 2) ground-truth quad
+    ordered top-left, top-right, bottom-right, bottom-left.
+    """
+    # Dark, low-saturation textured background so only the paper passes the white threshold
+    base = rng.integers(30, 90)
+    image = np.full((height, width, 3), base, np.uint8)
+    texture = rng.normal(0, 8, (height // 8 + 1, width // 8 + 1, 1))
+    image = np.clip(image + cv2.resize(texture, (width, height))[:, :, None], 0, 255).astype(np.uint8)
+
+    # Coloured clutter: saturated shapes and small white specks below the contour area limit
+    for _ in range(clutter):
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(5, max(6, min(width, height) // 6)))
+        if rng.random() < 0.5:
+            cv2.circle(image, (x, y), size, color, -1)
+        else:
+            cv2.rectangle(image, (x, y), (x + size, y + size // 2), color, -1)
+        if rng.random() < 0.3:
+            cv2.circle(image, (int(rng.integers(0, width)), int(rng.integers(0, height))), 3, (250, 250, 250), -1)
+
+    # Paper pose: A4-ish aspect, random scale, rotation, offset and perspective jitter
+    scale = rng.uniform(0.3, 0.55) * min(width, height)
+    w, h = scale, scale * 1.3
+    rect = np.array([[-w / 2, -h / 2], [w / 2, -h / 2], [w / 2, h / 2], [-w / 2, h / 2]])
+    theta = np.radians(rng.uniform(-25, 25))
+    R = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    corners = rect @ R.T + rng.normal(0, 0.04 * scale, (4, 2))
+    center = np.array([width / 2, height / 2]) + rng.uniform(-0.15, 0.15, 2) * (width, height)
+    corners = (corners + center).astype(np.float32)
+
+    paper = int(rng.integers(200, 250))
+    # Draw at 4x sub-pixel precision so ground truth isn't quantised to whole pixels
+    cv2.fillPoly(image, [np.round(corners * 4).astype(np.int32)], (paper, paper, paper),
+                 lineType=cv2.LINE_AA, shift=2)
+
+    if noise > 0:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    return image, corners
+
+
+def _time(fn: Callable, *args) -> Tuple[float, object]:
+    start = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - start, out
+
+
+def run_case(width: int, height: int, frames: int, noise: float, clutter: int, seed: int,
+             process_kwargs: Dict) -> Dict:
+    """Benchmark one resolution/noise/clutter combination."""
+    rng = np.random.default_rng(seed)
+    scenes = [render_scene(width, height, rng, noise, clutter) for _ in range(frames)]
+    truth = quad_metrics_batch(np.stack([corners for _, corners in scenes]))
+
+    timings: Dict[str, List[float]] = {"preprocess": [], "segment_notebook": [],
+                                       "transform_perspective": [], "process_image": []}
+    peak_bytes = []
+    found = np.zeros(frames, bool)
+    centers = np.full((frames, 2), np.nan)
+    angles = np.full(frames, np.nan)
+    rects = np.full((frames, 4, 2), np.nan)
+
+    for i, (image, _) in enumerate(scenes):
+        elapsed, (_, thresh) = _time(preprocess, image)
+        timings["preprocess"].append(elapsed)
+        elapsed, contour = _time(segment_notebook, thresh)
+        timings["segment_notebook"].append(elapsed)
+        if contour is not None:
+            elapsed, _ = _time(transform_perspective, image, contour)
+            timings["transform_perspective"].append(elapsed)
+
+        # Full pipeline, including the warp so results stay comparable with process_image
+        start = time.perf_counter()
+        try:
+            result = analyze_image(image, **process_kwargs)
+            result.warped
+            found[i] = True
+            centers[i], angles[i], rects[i] = result.center, result.angle, result.rect
+        except RuntimeError:
+            pass
+        timings["process_image"].append(time.perf_counter() - start)
+
+        # Separate pass for allocations, since tracing slows down the timed one
+        tracemalloc.start()
+        try:
+            analyze_image(image, **process_kwargs).warped
+        except RuntimeError:
+            pass
+        peak_bytes.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    corner_error = np.linalg.norm(rects - truth["rects"], axis=2).mean(axis=1)
+    center_error = np.linalg.norm(centers - truth["centers"], axis=1)
+    angle_error = np.abs(angles - truth["angles"])
+    total = sum(timings["process_image"])
+    return {
+        "resolution": f"{width}x{height}",
+        "noise": noise,
+        "clutter": clutter,
+        "frames": frames,
+        "fps": frames / total if total > 0 else float("inf"),
+        "timings_ms": {name: 1000 * float(np.median(values)) if values else float("nan")
+                       for name, values in timings.items()},
+        "peak_kib_per_frame": float(np.median(peak_bytes)) / 1024,
+        "detection_rate": float(found.mean()),
+        "corner_error_px": float(np.nanmean(corner_error)) if found.any() else float("nan"),
+        "center_error_px": float(np.nanmean(center_error)) if found.any() else float("nan"),
+        "angle_error_deg": float(np.nanmean(angle_error)) if found.any() else float("nan"),
+    }
+
+
+def format_row(r: Dict) -> str:
+    t = r["timings_ms"]
+    return (f"{r['resolution']:>10} noise={r['noise']:<4} clutter={r['clutter']:<3} "
+            f"{r['fps']:7.1f} fps | pre {t['preprocess']:6.2f} seg {t['segment_notebook']:5.2f} "
+            f"warp {t['transform_perspective']:5.2f} total {t['process_image']:6.2f} ms | "
+            f"{r['peak_kib_per_frame']:8.0f} KiB | det {100 * r['detection_rate']:5.1f}% "
+            f"corner {r['corner_error_px']:5.2f}px center {r['center_error_px']:5.2f}px "
+            f"angle {r['angle_error_deg']:5.2f}deg")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark processing.py on synthetic scenes")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--resolutions", default="320x240,1280x720,1920x1080")
+    parser.add_argument("--noise", default="0,8", help="comma separated Gaussian noise sigmas")
+    parser.add_argument("--clutter", default="0,10", help="comma separated clutter shape counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="passed to analyze_image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for resolution in args.resolutions.split(","):
+        width, height = (int(v) for v in resolution.split("x"))
+        for noise in (float(v) for v in args.noise.split(",")):
+            for clutter in (int(v) for v in args.clutter.split(",")):
+                result = run_case(width, height, args.frames, noise, clutter, args.seed, {"scale": args.scale})
+                print(format_row(result))
+                results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
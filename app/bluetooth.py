@@ -1,9 +1,10 @@
 import serial
 import struct
 import time
-import cv2
-import numpy as np
 import threading
+from display import WindowSink
+from processing import JpegFrame
+from protocol import MODE_BINARY, ACK_MODE_BINARY, BinaryCommandEncoder, encode_text_command, is_ack, decode_ack
 
 # Adjust the serial port and baud rate as needed.
 SERIAL_PORT = '/dev/rfcomm0'
@@ -12,9 +13,27 @@ BAUD_RATE = 115200
 # Global flag to signal exit
 exit_flag = False
 
-def send_servo_command(ser, angle1, angle2):
+def request_binary_mode(ser, timeout=2.0):
+    """Ask the ESP32 to switch to binary servo commands.
+       Frames are read (and dropped) until it acks; returns a BinaryCommandEncoder,
+       or None if no ack came within timeout and text commands should be used.
+    """
+    confirmed = threading.Event()
+
+    def on_ack(seq, status):
+        if status == ACK_MODE_BINARY:
+            confirmed.set()
+
+    ser.write(MODE_BINARY)
+    deadline = time.perf_counter() + timeout
+    while not confirmed.is_set() and time.perf_counter() < deadline:
+        read_frame(ser, on_ack)
+    return BinaryCommandEncoder(ack=True) if confirmed.is_set() else None
+
+def send_servo_command(ser, angle1, angle2, encoder=None):
     """Send a servo command to set the servos to the given angles.
-       The command format is: "CMD:<angle1>,<angle2>\n"
+       The command format is: "CMD:<angle1>,<angle2>\n",
+       or a fixed-size binary frame if a BinaryCommandEncoder is given.
     """
     if not ser.is_open:
         try:
@@ -22,15 +41,17 @@ def send_servo_command(ser, angle1, angle2):
         except Exception as e:
             print("Failed to open port before writing:", e)
             return
-    command = f"CMD:{angle1},{angle2}\n"
+    command = encode_text_command(angle1, angle2) if encoder is None else encoder.encode(angle1, angle2)
     try:
-        ser.write(command.encode())
-        print(f"Sent servo command: {command.strip()}")
+        ser.write(command)
+        print(f"Sent servo command: {angle1},{angle2}")
     except Exception as e:
         print("Error writing to port:", e)
 
-def read_frame(ser):
-    """Read a single video frame from the serial port."""
+def read_frame(ser, on_ack=None):
+    """Read a single video frame from the serial port.
+       Compact acks in the stream are passed to on_ack(seq, status) and skipped.
+    """
     if not ser.is_open:
         try:
             ser.open()
@@ -38,21 +59,29 @@ def read_frame(ser):
             print("Failed to open port before reading:", e)
             return None
 
-    header = ser.read(4)
-    if len(header) < 4:
-        print("Incomplete header received")
-        return None
+    while True:
+        header = ser.read(4)
+        if len(header) < 4:
+            print("Incomplete header received")
+            return None
+
+        frame_size = struct.unpack('<I', header)[0]
+        if not is_ack(frame_size):
+            break
+        # Compact ack from the binary command protocol, not a frame
+        if on_ack is not None:
+            on_ack(*decode_ack(frame_size))
 
-    frame_size = struct.unpack('<I', header)[0]
     data = ser.read(frame_size)
     if len(data) < frame_size:
         print("Incomplete frame received")
         return None
     return data
 
-def servo_input_thread(ser):
+def servo_input_thread(ser, encoder=None):
     """Thread that reads user input from the terminal and sends servo commands.
        Expected input: two comma-separated angle values, e.g., "90,45".
+       Commands are sent as binary frames if an encoder is given.
     """
     global exit_flag
     while not exit_flag:
@@ -74,38 +103,59 @@ def servo_input_thread(ser):
             angle1 = int(parts[0].strip())
             angle2 = int(parts[1].strip())
             if 0 <= angle1 <= 180 and 0 <= angle2 <= 180:
-                send_servo_command(ser, angle1, angle2)
+                send_servo_command(ser, angle1, angle2, encoder)
             else:
                 print("Both angles must be between 0 and 180.")
         except ValueError:
             print("Invalid input. Please enter numeric values for the angles.")
 
-def main():
+def main(sink=None, port=SERIAL_PORT, process_frame=None, reduction=2, binary=True):
+    """Stream frames from the ESP32 to sink (a HighGUI window by default).
+       port can also be the pty printed by "simulator.py --pty".
+       process_frame, e.g. lambda frame: analyze_jpeg(frame, tracker=tracker), gets each frame as a
+       JpegFrame and can track on its 1/reduction size decode; the full-size decode only happens
+       for an active sink or if process_frame reads the full image.
+       With binary=True, binary servo commands are negotiated, falling back to text if the ESP32 doesn't ack.
+    """
     global exit_flag
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=10)
+        ser = serial.Serial(port, BAUD_RATE, timeout=10)
     except Exception as e:
-        print(f"Failed to open {SERIAL_PORT}: {e}")
+        print(f"Failed to open {port}: {e}")
         return
+    sink = sink or WindowSink()
+
+    encoder = None
+    if binary:
+        encoder = request_binary_mode(ser)
+        print("Using binary servo commands." if encoder else "ESP32 did not confirm binary mode, using text commands.")
+    on_ack = encoder.handle_ack if encoder else None
 
     # Start the servo input thread.
-    input_thread = threading.Thread(target=servo_input_thread, args=(ser,), daemon=True)
+    input_thread = threading.Thread(target=servo_input_thread, args=(ser, encoder), daemon=True)
     input_thread.start()
 
     print("Starting video stream. Press 'q' in the video window or enter 'q' in the terminal to quit.")
 
     try:
         while not exit_flag:
-            frame_data = read_frame(ser)
+            frame_data = read_frame(ser, on_ack)
             if frame_data is None:
                 # If frame reading fails, wait a bit and try again.
                 time.sleep(0.1)
                 continue
 
-            # Convert the JPEG data to a NumPy array
-            np_arr = np.frombuffer(frame_data, dtype=np.uint8)
-            # Decode the image from the NumPy array
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            # Decoded lazily, at reduced size for tracking and in full only if needed
+            jpeg = JpegFrame(frame_data, reduction)
+            if process_frame is not None:
+                try:
+                    process_frame(jpeg)
+                except Exception as e:
+                    print(f"Frame processing error: {e}")
+            if not sink.active:
+                continue
+
+            frame = jpeg.full
             if frame is None:
                 print("Failed to decode frame")
                 continue
@@ -114,10 +164,8 @@ def main():
             height, width = frame.shape[:2]
             print(f"Frame resolution: {width} x {height}")
 
-            # Display the frame in a window
-            cv2.imshow("Live Stream", frame)
-            # Wait 1ms for key event. Press 'q' in the video window to quit.
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # Display the frame. Press 'q' in the video window to quit.
+            if not sink.show("Live Stream", frame):
                 exit_flag = True
                 break
 
@@ -126,7 +174,7 @@ def main():
     finally:
         exit_flag = True
         ser.close()
-        cv2.destroyAllWindows()
+        sink.close()
         input_thread.join()
 
 if __name__ == '__main__':
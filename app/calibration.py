@@ -0,0 +1,276 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from processing import (HSV_LOWER, HSV_UPPER, PAPER_THRESHOLD, HsvThreshold, JpegProcessResult, ProcessResult,
+                        order_points)
+
+
+class SceneProfiles:
+    """
+    Threshold bounds per scene, persisted as JSON:
+    {"<scene>": {"lower": [h, s, v], "upper": [h, s, v], "brightness": mean frame brightness, "updated": unix time}}
+    """
+    def __init__(self, path: str = "threshold_profiles.json"):
+        self.path = path
+        self.profiles: Dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self.profiles = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Could not load threshold profiles from {path}: {e}")
+
+    def get(self, scene: str) -> Optional[dict]:
+        return self.profiles.get(scene)
+
+    def put(self, scene: str, lower: np.ndarray, upper: np.ndarray, brightness: float) -> None:
+        self.profiles[scene] = {
+            "lower": [int(v) for v in lower],
+            "upper": [int(v) for v in upper],
+            "brightness": float(brightness),
+            "updated": time.time(),
+        }
+
+    def closest(self, brightness: float) -> Optional[Tuple[str, dict]]:
+        """The profile recorded under the most similar lighting."""
+        if not self.profiles:
+            return None
+        return min(self.profiles.items(), key=lambda item: abs(item[1].get("brightness", 0.0) - brightness))
+
+    def save(self) -> None:
+        # Write then rename, so a crash mid-write never leaves a truncated file behind
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.profiles, file, indent=2)
+        os.replace(tmp, self.path)
+
+
+def _percentile(hist: np.ndarray, q: float) -> int:
+    """Value below which a fraction q of a 256-bin histogram lies."""
+    cumulative = np.cumsum(hist)
+    return int(np.searchsorted(cumulative, q * cumulative[-1]))
+
+
+def frame_brightness(image: np.ndarray) -> float:
+    """Mean intensity over all channels, used to match frames to scene profiles."""
+    return float(np.mean(cv2.mean(image)[:3]))
+
+
+class ThresholdCalibrator:
+    """
+    Keeps the white paper threshold tuned to the lighting, from S/V histograms of paper and background
+    around each detection. After recover_after failures in a row it tries fallback bounds in turn.
+    The bounds are stored as the profile for scene and loaded at startup.
+    threshold is the HsvThreshold it tunes, a copy of PAPER_THRESHOLD by default; segment with it
+    (see wrap) so other callers of preprocess keep the default bounds.
+    """
+    def __init__(self, profiles: Optional[SceneProfiles] = None, scene: str = "default",
+                 threshold: Optional[HsvThreshold] = None, history: int = 30, update_every: int = 10,
+                 grid: int = 32, alpha: float = 0.3, v_margin: int = 25, s_margin: int = 20,
+                 min_v: int = 60, max_s: int = 120, recover_after: int = 5, autosave_interval: float = 30.0):
+        self.profiles = profiles
+        self.scene = scene
+        if threshold is None:
+            threshold = HsvThreshold(PAPER_THRESHOLD.lower, PAPER_THRESHOLD.upper)
+        self.threshold = threshold
+        self.update_every = update_every
+        # Sample positions along each side of the quad
+        self._grid = np.linspace(0.05, 0.95, grid)
+        self._u, self._v = (g.reshape(-1, 1) for g in np.meshgrid(self._grid, self._grid))
+        self.alpha = alpha
+        self.v_margin = v_margin
+        self.s_margin = s_margin
+        self.min_v = min_v
+        self.max_s = max_s
+        self.recover_after = recover_after
+        self.autosave_interval = autosave_interval
+        self._hists = deque(maxlen=history)
+        self._since_update = 0
+        self._failures = 0
+        self._candidate = 0
+        self._primed = False
+        self._dirty = False
+        self._last_save = time.perf_counter()
+        self.last_good = (threshold.lower.copy(), threshold.upper.copy())
+        self.brightness = None
+        self.updates = 0
+        self.recoveries = 0
+
+        profile = profiles.get(scene) if profiles is not None else None
+        if profile is not None:
+            self._apply(profile["lower"], profile["upper"])
+            self._primed = True
+            print(f"Loaded threshold profile '{scene}': lower={profile['lower']} upper={profile['upper']}")
+
+    def _apply(self, lower, upper) -> None:
+        self.threshold.set_bounds(lower, upper)
+
+    def prime(self, image: np.ndarray) -> None:
+        """Without a profile for this scene, start from the one recorded under the most similar lighting."""
+        self._primed = True
+        if self.profiles is None:
+            return
+        match = self.profiles.closest(frame_brightness(image))
+        if match is not None:
+            name, profile = match
+            self._apply(profile["lower"], profile["upper"])
+            print(f"Using threshold profile '{name}' for scene '{self.scene}'")
+
+    def _sample(self, image: np.ndarray, quad: np.ndarray) -> Optional[Tuple[np.ndarray, ...]]:
+        """S and V histograms of paper pixels inside quad and background pixels around it."""
+        h, w = image.shape[:2]
+        tl, tr, br, bl = order_points(quad.reshape(-1, 2).astype(np.float32))
+        center = (tl + tr + br + bl) / 4
+        # Paper: a bilinear grid over the quad, kept away from its edges
+        u, v = self._u, self._v
+        paper = (1 - v) * ((1 - u) * tl + u * tr) + v * ((1 - u) * bl + u * br)
+        # Background: points along the outline pushed 10-35% further out from the center
+        outline = np.concatenate([a + self._grid.reshape(-1, 1) * (b - a)
+                                  for a, b in ((tl, tr), (tr, br), (br, bl), (bl, tl))])
+        scales = np.linspace(1.1, 1.35, 4).reshape(-1, 1, 1)
+        background = (center + scales * (outline - center)).reshape(-1, 2)
+
+        hists = []
+        for points in (paper, background):
+            points = np.round(points).astype(np.int32)
+            inside = (points[:, 0] >= 0) & (points[:, 0] < w) & (points[:, 1] >= 0) & (points[:, 1] < h)
+            if inside.sum() < 50:
+                return None
+            pixels = image[points[inside, 1], points[inside, 0]]
+            hsv = cv2.cvtColor(pixels.reshape(-1, 1, 3), cv2.COLOR_BGR2HSV).reshape(-1, 3)
+            hists.append(np.bincount(hsv[:, 1], minlength=256))
+            hists.append(np.bincount(hsv[:, 2], minlength=256))
+        return tuple(hists)
+
+    def observe(self, image: np.ndarray, quad: np.ndarray) -> None:
+        """Record a successful detection of quad (in image coordinates)."""
+        self._failures = 0
+        self._candidate = 0
+        self.last_good = (self.threshold.lower.copy(), self.threshold.upper.copy())
+        hists = self._sample(image, quad)
+        if hists is None:
+            return
+        self._hists.append(hists)
+        self._since_update += 1
+        if self._since_update >= self.update_every:
+            self._since_update = 0
+            self.brightness = frame_brightness(image)
+            self._update()
+
+    def _update(self) -> None:
+        paper_s, paper_v, background_s, background_v = (sum(h[i] for h in self._hists) for i in range(4))
+        darkest_paper, brightest_background = _percentile(paper_v, 0.02), _percentile(background_v, 0.95)
+        if brightest_background < darkest_paper:
+            v_low = (darkest_paper + brightest_background) / 2
+        else:
+            v_low = darkest_paper - self.v_margin
+        most_saturated_paper, least_saturated_background = _percentile(paper_s, 0.98), _percentile(background_s, 0.05)
+        if least_saturated_background > most_saturated_paper:
+            s_high = (most_saturated_paper + least_saturated_background) / 2
+        else:
+            s_high = most_saturated_paper + self.s_margin
+        v_low = float(np.clip(v_low, self.min_v, 250))
+        s_high = float(np.clip(s_high, 10, self.max_s))
+
+        lower, upper = self.threshold.lower.copy(), self.threshold.upper.copy()
+        lower[2] = round((1 - self.alpha) * lower[2] + self.alpha * v_low)
+        upper[1] = round((1 - self.alpha) * upper[1] + self.alpha * s_high)
+        if np.array_equal(lower, self.threshold.lower) and np.array_equal(upper, self.threshold.upper):
+            return
+        self._apply(lower, upper)
+        self.updates += 1
+        self._dirty = True
+        if time.perf_counter() - self._last_save >= self.autosave_interval:
+            self.save()
+
+    def _candidates(self, image: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        candidates = []
+        if self.profiles is not None:
+            match = self.profiles.closest(frame_brightness(image))
+            if match is not None:
+                candidates.append((match[1]["lower"], match[1]["upper"]))
+        candidates.append(self._relaxed(*self.last_good, 1))
+        candidates.append((HSV_LOWER, HSV_UPPER))
+        candidates.append(self._relaxed(HSV_LOWER, HSV_UPPER, 2))
+        return candidates
+
+    def _relaxed(self, lower: np.ndarray, upper: np.ndarray, steps: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Bounds widened by steps margins towards darker and more saturated paper."""
+        lower, upper = np.array(lower, np.uint8), np.array(upper, np.uint8)
+        lower[2] = max(int(lower[2]) - steps * self.v_margin, self.min_v)
+        upper[1] = min(int(upper[1]) + steps * self.s_margin, self.max_s)
+        return lower, upper
+
+    def failed(self, image: np.ndarray) -> None:
+        """Record a failed detection; after recover_after in a row, switch to the next fallback bounds."""
+        self._failures += 1
+        if self._failures % self.recover_after:
+            return
+        candidates = self._candidates(image)
+        lower, upper = candidates[self._candidate % len(candidates)]
+        self._candidate += 1
+        self._hists.clear()
+        self._since_update = 0
+        self._apply(lower, upper)
+        self.recoveries += 1
+        print(f"Segmentation failing, trying threshold lower={self.threshold.lower.tolist()} "
+              f"upper={self.threshold.upper.tolist()}")
+
+    def observe_result(self, result: ProcessResult) -> None:
+        """observe() for an analyze_image or analyze_jpeg result."""
+        if isinstance(result, JpegProcessResult):
+            # Sample the reduced decode that was segmented, rather than forcing a full one
+            r = result.frame.reduction
+            self.observe(result.frame.reduced, (result.rect + 0.5) / r - 0.5)
+        else:
+            self.observe(result.image, result.rect)
+
+    def wrap(self, process_frame: Callable) -> Callable:
+        """
+        Wrap a process_frame(frame, threshold) callback, e.g.
+            lambda frame, threshold: analyze_image(frame, tracker=tracker, threshold=threshold)
+        so it segments with the calibrated threshold and every detection and failure feeds the calibration.
+        """
+        def calibrated(frame):
+            image = frame.reduced if hasattr(frame, "reduced") else frame
+            if not self._primed and image is not None:
+                self.prime(image)
+            try:
+                result = process_frame(frame, self.threshold)
+            except RuntimeError:
+                if image is not None:
+                    self.failed(image)
+                raise
+            self.observe_result(result)
+            return result
+        return calibrated
+
+    def save(self) -> None:
+        """Store the current bounds as this scene's profile."""
+        self._last_save = time.perf_counter()
+        if self.profiles is None or not self._dirty or self.brightness is None:
+            return
+        self.profiles.put(self.scene, self.threshold.lower, self.threshold.upper, self.brightness)
+        try:
+            self.profiles.save()
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not save threshold profiles: {e}")
+
+    def close(self) -> None:
+        self.save()
+
+    def stats(self) -> dict:
+        return {
+            "lower": [int(v) for v in self.threshold.lower],
+            "upper": [int(v) for v in self.threshold.upper],
+            "updates": self.updates,
+            "recoveries": self.recoveries,
+            "table_builds": self.threshold.builds,
+        }
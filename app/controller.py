@@ -1,11 +1,56 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from instrumentation import INSTRUMENTS
+
+
+class CenterFilter:
+  """
+  Smooths detected centers before control so single-pixel detection noise doesn't move the servos.
+  A median over the last window centers rejects outliers, an EMA smooths what's left, and a
+  dead-band with hysteresis holds each axis still: it only starts moving once the smoothed
+  center is more than deadband pixels away, then keeps following until a frame moves less than release.
+  """
+  def __init__(self, window=5, alpha=0.5, deadband=4.0, release=1.5):
+    self.history = deque(maxlen=window)
+    self.alpha = alpha
+    self.deadband = deadband
+    self.release = release
+    self.smoothed = None
+    self.output = None
+    self.moving = np.zeros(2, dtype=bool)
+    self.suppressed = 0
+
+  def __call__(self, center):
+    self.history.append(center)
+    median = np.median(np.array(self.history, dtype=float), axis=0)
+    if self.smoothed is None:
+      self.smoothed = median
+      self.output = median
+    else:
+      self.smoothed = self.alpha * median + (1 - self.alpha) * self.smoothed
+      # Each axis has its own dead-band so motion along x doesn't drag y noise along
+      threshold = np.where(self.moving, self.release, self.deadband)
+      self.moving = np.abs(self.smoothed - self.output) > threshold
+      self.output = np.where(self.moving, self.smoothed, self.output)
+      if not self.moving.any():
+        self.suppressed += 1
+    return int(round(self.output[0])), int(round(self.output[1]))
+
+
 class Controller:
-  def __init__(self):
+  def __init__(self, center_filter=None):
     self.last_x = None
     self.last_y = None
     self.step_x = 5
     self.step_y = 5
+    self.center_filter = center_filter
 
   def get_angle(self, center):
+    if self.center_filter is not None:
+      center = self.center_filter(center)
     if self.last_x is None or self.last_y is None:
       self.last_x, self.last_y = center
       return 0, 0
@@ -17,3 +62,124 @@ class Controller:
     self.last_x, self.last_y = center
     return (dx // abs(dx) if dx != 0 else 0) * self.step_x, (dy // abs(dy) if dy != 0 else 0) * self.step_y
     
+
+
+class ConstantVelocityKalman:
+  """Kalman filter on [x, y, vx, vy] with a constant-velocity motion model."""
+  def __init__(self, center, process_noise=500.0, measurement_noise=4.0):
+    self.x = np.array([center[0], center[1], 0.0, 0.0])
+    self.P = np.diag([measurement_noise, measurement_noise, 1e4, 1e4])
+    self.q = process_noise
+    self.R = np.eye(2) * measurement_noise
+    self.H = np.array([[1.0, 0, 0, 0], [0, 1.0, 0, 0]])
+    self.updates = 0
+
+  def predict(self, dt):
+    F = np.eye(4)
+    F[0, 2] = F[1, 3] = dt
+    # White-noise acceleration model
+    G = np.array([[dt * dt / 2, 0], [0, dt * dt / 2], [dt, 0], [0, dt]])
+    self.x = F @ self.x
+    self.P = F @ self.P @ F.T + self.q * G @ G.T
+
+  def update(self, center):
+    y = np.asarray(center, dtype=float) - self.H @ self.x
+    S = self.H @ self.P @ self.H.T + self.R
+    K = self.P @ self.H.T @ np.linalg.inv(S)
+    self.x = self.x + K @ y
+    self.P = (np.eye(4) - K @ self.H) @ self.P
+    self.updates += 1
+
+  @property
+  def position(self):
+    return self.x[:2]
+
+  @property
+  def velocity(self):
+    return self.x[2:]
+
+
+class PredictiveController:
+  """
+  Same interface as Controller, but estimates the notebook velocity with a Kalman filter,
+  predicts where it will be once the command takes effect and outputs PID angle commands
+  proportional to the remaining error instead of a fixed step.
+
+  aim is the pixel position the mirror currently tracks; each command moves it by
+  angle / degrees_per_pixel, so the error shrinks over a few frames instead of creeping
+  at step_x per frame. With latency=None the prediction horizon is the measured p50 of the
+  first of latency_stages that INSTRUMENTS has samples for, default_latency until then.
+  A detection further than reacquire_distance pixels from the prediction (the notebook
+  jumped or was re-detected) restarts the filter there instead of being read as a burst
+  of velocity, which is what made steps overshoot.
+  An optional CenterFilter adds a dead-band in front of the Kalman filter.
+  """
+  def __init__(self, latency=None, degrees_per_pixel=0.1, kp=0.7, ki=0.0, kd=0.0,
+               max_step=15, process_noise=200.0, measurement_noise=4.0, reacquire_distance=15.0,
+               center_filter=None, default_latency=0.1, latency_stages=("glass_to_servo", "end_to_end"),
+               instruments=INSTRUMENTS):
+    self.latency = latency
+    self.degrees_per_pixel = degrees_per_pixel
+    self.kp = kp
+    self.ki = ki
+    self.kd = kd
+    self.max_step = max_step
+    self.process_noise = process_noise
+    self.measurement_noise = measurement_noise
+    self.reacquire_distance = reacquire_distance
+    self.center_filter = center_filter
+    self.default_latency = default_latency
+    self.latency_stages = latency_stages
+    self.instruments = instruments
+    self.reset()
+
+  def reset(self):
+    self.filter = None
+    self.aim = None
+    self.last_time = None
+    self.integral = np.zeros(2)
+    self.last_error = np.zeros(2)
+
+  def lead_time(self):
+    """Seconds to predict ahead: latency if set, else the measured p50 latency."""
+    if self.latency is not None:
+      return self.latency
+    for stage in self.latency_stages:
+      histogram = self.instruments.histograms.get(stage)
+      if histogram is not None and histogram.count:
+        return float(histogram.percentiles((50,))[0])
+    return self.default_latency
+
+  def get_angle(self, center, timestamp=None):
+    now = time.perf_counter() if timestamp is None else timestamp
+    if self.center_filter is not None:
+      center = self.center_filter(center)
+    if self.filter is None:
+      self.filter = ConstantVelocityKalman(center, self.process_noise, self.measurement_noise)
+      self.aim = np.array(center, dtype=float)
+      self.last_time = now
+      return 0, 0
+
+    dt = max(now - self.last_time, 1e-3)
+    self.last_time = now
+    self.filter.predict(dt)
+    # A fresh filter has no velocity yet, so its first update is never treated as a jump
+    jump = np.linalg.norm(np.asarray(center, dtype=float) - self.filter.position)
+    if self.filter.updates and jump > self.reacquire_distance:
+      self.filter = ConstantVelocityKalman(center, self.process_noise, self.measurement_noise)
+      self.integral[:] = 0
+      self.last_error[:] = 0
+    else:
+      self.filter.update(center)
+
+    # Aim for where the notebook will be when this command lands
+    predicted = self.filter.position + self.filter.velocity * self.lead_time()
+    error = predicted - self.aim
+    self.integral += error * dt
+    derivative = (error - self.last_error) / dt
+    self.last_error = error
+
+    command = self.degrees_per_pixel * (self.kp * error + self.ki * self.integral + self.kd * derivative)
+    command = np.clip(np.round(command), -self.max_step, self.max_step).astype(int)
+    self.aim += command / self.degrees_per_pixel
+    return int(command[0]), int(command[1])
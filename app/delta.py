@@ -0,0 +1,189 @@
+"""
+Tile-based delta encoding of the warped notebook view for the phone link.
+
+Wire format, version 1. Every message starts with a little-endian header:
+
+    magic "DVTD" | version u8 | flags u8 | width u16 | height u16 | tile u16 | count u16 | seq u32
+
+flags bit 0 marks a keyframe: count is 1 and the payload is a single JPEG of the whole frame.
+Otherwise the payload is count tiles, each "tx u16 | ty u16 | length u32" followed by a JPEG
+of that tile, to be drawn at (tx * tile, ty * tile) over the previous frame. A decoder that
+missed a message must drop deltas until the next keyframe.
+"""
+import struct
+import threading
+from typing import Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MAGIC = b"DVTD"
+WIRE_VERSION = 1
+FLAG_KEYFRAME = 0x01
+HEADER = struct.Struct("<4sBBHHHHI")
+TILE_HEADER = struct.Struct("<HHI")
+
+
+def _encode_jpeg(image: np.ndarray, quality: int) -> bytes:
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+def _decode_jpeg(data: bytes) -> np.ndarray:
+    """Decode as the client will, keeping the channel count of what was encoded."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class TileDeltaEncoder:
+    """
+    Splits frames into tile x tile blocks and only encodes blocks whose mean absolute
+    difference from what the decoder already has exceeds threshold. A keyframe is sent
+    first, every keyframe_interval messages, on request, and when the frame size changes
+    by more than resize_tolerance (smaller changes, e.g. the warp size jittering by a pixel,
+    are absorbed by resizing to the current keyframe size).
+    The reference is kept as the decoder sees it, i.e. built from the decoded JPEGs, so
+    compression error is compared against (and corrected) instead of accumulating.
+    """
+    def __init__(self, tile: int = 32, threshold: float = 6.0, keyframe_interval: int = 30,
+                 quality: int = 80, resize_tolerance: float = 0.1):
+        self.tile = tile
+        self.threshold = threshold
+        self.keyframe_interval = keyframe_interval
+        self.quality = quality
+        self.resize_tolerance = resize_tolerance
+        self.seq = 0
+        self.reference: Optional[np.ndarray] = None
+        self.since_keyframe = 0
+        self.force_keyframe = False
+        self.tiles_sent = 0
+        self.tiles_skipped = 0
+
+    def _needs_keyframe(self, frame: np.ndarray) -> bool:
+        if self.reference is None or self.force_keyframe or self.since_keyframe >= self.keyframe_interval:
+            return True
+        h, w = self.reference.shape[:2]
+        return abs(frame.shape[0] - h) > self.resize_tolerance * h or abs(frame.shape[1] - w) > self.resize_tolerance * w
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        """Encode the next message for frame."""
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        if self._needs_keyframe(frame):
+            self.since_keyframe = 1
+            self.force_keyframe = False
+            h, w = frame.shape[:2]
+            jpeg = _encode_jpeg(frame, self.quality)
+            self.reference = _decode_jpeg(jpeg)
+            return HEADER.pack(MAGIC, WIRE_VERSION, FLAG_KEYFRAME, w, h, self.tile, 1, self.seq) \
+                + TILE_HEADER.pack(0, 0, len(jpeg)) + jpeg
+
+        h, w = self.reference.shape[:2]
+        if frame.shape[:2] != (h, w):
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+
+        t = self.tile
+        rows, cols = -(-h // t), -(-w // t)
+        diff = cv2.absdiff(frame, self.reference)
+        if diff.ndim == 3:
+            diff = diff.mean(axis=2)
+        # Pad to whole tiles so every tile's sum comes out of a single reshape, then divide by
+        # the real pixel count so partial tiles on the right and bottom edges aren't diluted
+        padded = np.zeros((rows * t, cols * t), np.float32)
+        padded[:h, :w] = diff
+        tile_heights = np.minimum(t, h - t * np.arange(rows))
+        tile_widths = np.minimum(t, w - t * np.arange(cols))
+        tile_means = padded.reshape(rows, t, cols, t).sum(axis=(1, 3)) / np.outer(tile_heights, tile_widths)
+        changed = np.argwhere(tile_means > self.threshold)
+
+        parts = []
+        for ty, tx in changed:
+            y0, x0 = ty * t, tx * t
+            block = frame[y0:y0 + t, x0:x0 + t]
+            jpeg = _encode_jpeg(block, self.quality)
+            parts.append(TILE_HEADER.pack(tx, ty, len(jpeg)) + jpeg)
+            self.reference[y0:y0 + t, x0:x0 + t] = _decode_jpeg(jpeg)
+        self.tiles_sent += len(changed)
+        self.tiles_skipped += rows * cols - len(changed)
+        self.since_keyframe += 1
+        return HEADER.pack(MAGIC, WIRE_VERSION, 0, w, h, t, len(parts), self.seq) + b"".join(parts)
+
+
+class TileDeltaDecoder:
+    """Reference decoder for the wire format, e.g. for tests and desktop viewers."""
+    def __init__(self):
+        self.frame: Optional[np.ndarray] = None
+        self.seq: Optional[int] = None
+
+    def decode(self, message: bytes) -> Optional[np.ndarray]:
+        """Apply a message and return the current frame, or None while waiting for a keyframe."""
+        magic, version, flags, w, h, t, count, seq = HEADER.unpack_from(message)
+        if magic != MAGIC or version != WIRE_VERSION:
+            raise ValueError(f"Unsupported delta message (magic={magic!r}, version={version})")
+        keyframe = bool(flags & FLAG_KEYFRAME)
+        in_sequence = self.seq is not None and seq == (self.seq + 1) & 0xFFFFFFFF
+        if not keyframe and (self.frame is None or not in_sequence):
+            self.frame, self.seq = None, None
+            return None
+
+        offset = HEADER.size
+        for _ in range(count):
+            tx, ty, length = TILE_HEADER.unpack_from(message, offset)
+            offset += TILE_HEADER.size
+            block = cv2.imdecode(np.frombuffer(message, np.uint8, length, offset), cv2.IMREAD_COLOR)
+            offset += length
+            if keyframe:
+                self.frame = block
+            else:
+                y0, x0 = ty * t, tx * t
+                self.frame[y0:y0 + block.shape[0], x0:x0 + block.shape[1]] = block
+        self.seq = seq
+        return self.frame
+
+
+class DeltaBroadcaster:
+    """
+    Encodes each published frame once and shares the message with every subscriber.
+    Nothing is encoded while nobody is subscribed. A new or lagging subscriber forces the
+    next message to be a keyframe, since deltas are useless without the frames before them.
+    """
+    def __init__(self, encoder: Optional[TileDeltaEncoder] = None):
+        self.encoder = encoder or TileDeltaEncoder()
+        self.subscribers = 0
+        self._message: Optional[bytes] = None
+        self._index = 0
+        self._cond = threading.Condition()
+
+    def publish(self, frame: np.ndarray) -> None:
+        with self._cond:
+            if not self.subscribers:
+                return
+            self._message = self.encoder.encode(frame)
+            self._index += 1
+            self._cond.notify_all()
+
+    def subscribe(self, stop: Optional[threading.Event] = None) -> Iterator[bytes]:
+        """Yield messages framed like the ESP32 link: "<I" length prefix then the message."""
+        with self._cond:
+            self.subscribers += 1
+            self.encoder.force_keyframe = True
+            index = self._index
+        try:
+            while stop is None or not stop.is_set():
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self._index > index, timeout=1.0):
+                        continue
+                    if self._index > index + 1:
+                        # Missed a message; the next one will be a keyframe to resync on
+                        self.encoder.force_keyframe = True
+                    index, message = self._index, self._message
+                yield struct.pack("<I", len(message)) + message
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def message_info(message: bytes) -> Tuple[bool, int, int]:
+    """Return (keyframe, tile count, seq) of a message without decoding it."""
+    _, _, flags, _, _, _, count, seq = HEADER.unpack_from(message)
+    return bool(flags & FLAG_KEYFRAME), count, seq
@@ -0,0 +1,192 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+class DisplaySink:
+    """
+    Where the capture loops send frames for viewing. show() returns False when the
+    user asked to quit. The base class is the null sink (NullSink): pass it to any
+    capture loop to run headless, paying nothing for display and never touching HighGUI.
+    active tells producers whether frames are used at all, so they can skip
+    preparing them (e.g. a full-resolution JPEG decode) for the null sink.
+    """
+    active = False
+
+    def show(self, name: str, frame: np.ndarray) -> bool:
+        return True
+
+    def poll(self) -> bool:
+        """Keep the UI responsive while there is no frame to show; False if the user asked to quit."""
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+NullSink = DisplaySink
+
+
+class WindowSink(DisplaySink):
+    """The original behaviour: cv2.imshow every frame and poll the keyboard with waitKey(1)."""
+    active = True
+
+    def __init__(self, quit_keys: Sequence[int] = (ord('q'),)):
+        self.quit_keys = quit_keys
+
+    def show(self, name: str, frame: np.ndarray) -> bool:
+        cv2.imshow(name, frame)
+        return self.poll()
+
+    def poll(self) -> bool:
+        return (cv2.waitKey(1) & 0xFF) not in self.quit_keys
+
+    def close(self) -> None:
+        cv2.destroyAllWindows()
+
+
+class ThrottledSink(DisplaySink):
+    """Forward every Nth frame per window to another sink, downscaled by scale."""
+    def __init__(self, sink: DisplaySink, every: int = 5, scale: float = 0.5):
+        self.sink = sink
+        self.every = every
+        self.scale = scale
+        self.counts = {}
+
+    @property
+    def active(self) -> bool:
+        return self.sink.active
+
+    def show(self, name: str, frame: np.ndarray) -> bool:
+        count = self.counts.get(name, 0)
+        self.counts[name] = count + 1
+        if count % self.every:
+            return True
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return self.sink.show(name, frame)
+
+    def poll(self) -> bool:
+        return self.sink.poll()
+
+    def close(self) -> None:
+        self.sink.close()
+
+
+class SharedJpegFrame:
+    """
+    Latest frame shared between one producer and many consumers.
+    set() only stores a reference and bumps the version; the JPEG is encoded at most once
+    per version, on first request, and the bytes are shared by every consumer.
+    The producer must not modify a frame after handing it to set().
+    """
+    def __init__(self, quality: int = 80):
+        self.quality = quality
+        self.version = 0
+        self.encodes = 0
+        self._frame: Optional[np.ndarray] = None
+        self._jpeg: Optional[bytes] = None
+        self._jpeg_version = -1
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+
+    def set(self, frame: np.ndarray) -> None:
+        with self._cond:
+            self._frame = frame
+            self.version += 1
+            self._cond.notify_all()
+
+    def jpeg(self) -> Tuple[int, Optional[bytes]]:
+        """Return (version, JPEG bytes) of the latest frame, encoding it if nobody has yet."""
+        # Encoders are serialised so each version is encoded once, but the producer's
+        # set() never waits for an encode
+        with self._encode_lock:
+            with self._cond:
+                frame, version = self._frame, self.version
+            if frame is None:
+                return 0, None
+            if self._jpeg_version != version:
+                ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    self._jpeg = buf.tobytes()
+                    self._jpeg_version = version
+                    self.encodes += 1
+            return self._jpeg_version, self._jpeg
+
+    def wait_newer(self, version: int, timeout: Optional[float] = None) -> bool:
+        """Block until a frame newer than version is available. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > version, timeout)
+
+
+def mjpeg_stream(shared, stop: Optional[threading.Event] = None, boundary: str = "frame"):
+    """
+    Yield multipart/x-mixed-replace chunks for every new frame in shared, which can be
+    anything with wait_newer() and jpeg() (a SharedJpegFrame or a frame_cache.EncodedFrameCache).
+    """
+    version = 0
+    while stop is None or not stop.is_set():
+        if not shared.wait_newer(version, timeout=1.0):
+            continue
+        version, jpeg = shared.jpeg()
+        if jpeg is None:
+            continue
+        yield (f"--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n").encode() \
+            + jpeg + b"\r\n"
+
+
+class MjpegHttpSink(DisplaySink):
+    """
+    Serve frames as an MJPEG stream over HTTP (http://host:port/<window name>) from a background thread.
+    show() only hands over a reference; JPEG encoding happens in the server threads, once per
+    frame and only while someone is watching.
+    """
+    active = True
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8081, quality: int = 80):
+        self.streams = {}
+        self._stop = threading.Event()
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                shared = sink.streams.get(self.path.strip("/"))
+                if shared is None:
+                    names = ", ".join(f"/{name}" for name in sink.streams) or "none yet"
+                    self.send_error(404, f"Available streams: {names}")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                try:
+                    for chunk in mjpeg_stream(shared, sink._stop):
+                        self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.quality = quality
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"MJPEG preview at http://{host}:{self.server.server_address[1]}/")
+
+    def show(self, name: str, frame: np.ndarray) -> bool:
+        # URL-friendly stream name derived from the window title
+        key = "".join(c if c.isalnum() else "_" for c in name.split("(")[0].strip()).lower()
+        shared = self.streams.get(key)
+        if shared is None:
+            shared = self.streams[key] = SharedJpegFrame(self.quality)
+        shared.set(frame)
+        return True
+
+    def close(self) -> None:
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,131 @@
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class Variant(NamedTuple):
+    """One encoding of a frame: format (".jpg" or ".png"), JPEG quality and downscale factor."""
+    ext: str
+    quality: int = 80
+    scale: float = 1.0
+
+    @property
+    def mimetype(self) -> str:
+        return "image/png" if self.ext == ".png" else "image/jpeg"
+
+
+VARIANTS: Dict[str, Variant] = {
+    "full": Variant(".jpg", 80, 1.0),
+    "low": Variant(".jpg", 50, 0.5),
+    "thumb": Variant(".jpg", 40, 0.25),
+    "png": Variant(".png", 0, 1.0),
+}
+
+
+class EncodedFrameCache:
+    """
+    Pre-encoded bytes of the latest frames, keyed by (frame sequence number, variant).
+    publish() only stores a reference and bumps the sequence number; each variant is encoded
+    once, on first request, and then served from the cache to every client. Entries are evicted
+    least-recently-used first once their total size exceeds max_bytes.
+    Also usable as the source of display.mjpeg_stream.
+    ETags include a random nonce, since sequence numbers start over when the server restarts.
+    """
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, variants: Optional[Dict[str, Variant]] = None):
+        self.max_bytes = max_bytes
+        self.variants = variants or VARIANTS
+        self.version = 0
+        self.nonce = secrets.token_hex(4)
+        self.encodes = 0
+        self.hits = 0
+        self.evictions = 0
+        self.size = 0
+        self._frame: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[Tuple[int, str], bytes]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+
+    def publish(self, frame: np.ndarray) -> int:
+        """Make frame the latest one. The caller must not modify it afterwards."""
+        with self._cond:
+            self._frame = frame
+            self.version += 1
+            self._cond.notify_all()
+            return self.version
+
+    def etag(self, variant: str = "full", version: Optional[int] = None) -> str:
+        return f"{self.nonce}-{self.version if version is None else version}-{variant}"
+
+    def get(self, variant: str = "full") -> Tuple[int, Optional[bytes]]:
+        """Return (sequence number, encoded bytes) of the latest frame in the given variant."""
+        spec = self.variants[variant]
+        with self._cond:
+            frame, version = self._frame, self.version
+            if frame is None:
+                return 0, None
+            data = self._lookup((version, variant))
+            if data is not None:
+                return version, data
+
+        # Serialise encoders so concurrent requests for the same frame encode it once,
+        # without holding up publish()
+        with self._encode_lock:
+            with self._cond:
+                data = self._lookup((version, variant))
+            if data is not None:
+                return version, data
+            data = self._encode(frame, spec)
+            if data is None:
+                return version, None
+            with self._cond:
+                self.encodes += 1
+                self._entries[(version, variant)] = data
+                self.size += len(data)
+                self._evict()
+            return version, data
+
+    def jpeg(self) -> Tuple[int, Optional[bytes]]:
+        """Full-size JPEG of the latest frame, the interface display.mjpeg_stream expects."""
+        return self.get("full")
+
+    def wait_newer(self, version: int, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.version > version, timeout)
+
+    def _lookup(self, key: Tuple[int, str]) -> Optional[bytes]:
+        """Return a cached entry and mark it recently used. Must hold the lock."""
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until within budget, always keeping the newest. Must hold the lock."""
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, data = self._entries.popitem(last=False)
+            self.size -= len(data)
+            self.evictions += 1
+
+    @staticmethod
+    def _encode(frame: np.ndarray, spec: Variant) -> Optional[bytes]:
+        if spec.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=spec.scale, fy=spec.scale, interpolation=cv2.INTER_AREA)
+        params = [cv2.IMWRITE_JPEG_QUALITY, spec.quality] if spec.ext == ".jpg" else []
+        ok, buf = cv2.imencode(spec.ext, frame, params)
+        return buf.tobytes() if ok else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "version": self.version,
+                "encodes": self.encodes,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
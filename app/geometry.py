@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def order_points_batch(quads: np.ndarray) -> np.ndarray:
+    """
+    Order every quad in an (N, 4, 2) array as top-left, top-right, bottom-right, bottom-left.
+    Same rule as processing.order_points: extremes of x+y and y-x. A single (4, 2) quad is a
+    batch of one; any other shape (e.g. a contour or a hull) raises ValueError, use
+    processing.order_points to pick the corners of those.
+    """
+    quads = np.asarray(quads)
+    if quads.shape == (4, 2):
+        quads = quads[None]
+    if quads.ndim != 3 or quads.shape[1:] != (4, 2):
+        raise ValueError(f"Expected (N, 4, 2) or (4, 2) quads, got shape {quads.shape}")
+    s = quads.sum(axis=2)
+    diff = quads[:, :, 1] - quads[:, :, 0]
+    idx = np.stack([np.argmin(s, axis=1), np.argmin(diff, axis=1),
+                    np.argmax(s, axis=1), np.argmax(diff, axis=1)], axis=1)
+    return np.take_along_axis(quads, idx[:, :, None], axis=1).astype(np.float32)
+
+
+def quad_sizes_batch(rects: np.ndarray) -> np.ndarray:
+    """
+    Output (width, height) of the perspective warp for each ordered quad, as an (N, 2) int array.
+    """
+    tl, tr, br, bl = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+    width = np.maximum(np.linalg.norm(br - bl, axis=1), np.linalg.norm(tr - tl, axis=1))
+    height = np.maximum(np.linalg.norm(tr - br, axis=1), np.linalg.norm(tl - bl, axis=1))
+    return np.stack([width, height], axis=1).astype(np.int64)
+
+
+def quad_angles_batch(rects: np.ndarray) -> np.ndarray:
+    """Rotation angle in degrees of the top edge of each ordered quad."""
+    top = rects[:, 1] - rects[:, 0]
+    return np.degrees(np.arctan2(top[:, 1], top[:, 0]))
+
+
+def warp_targets_batch(sizes: np.ndarray) -> np.ndarray:
+    """Destination corners of the warp for each (width, height), as an (N, 4, 2) float32 array."""
+    w = sizes[:, 0].astype(np.float32) - 1
+    h = sizes[:, 1].astype(np.float32) - 1
+    zeros = np.zeros_like(w)
+    return np.stack([np.stack([zeros, zeros], 1), np.stack([w, zeros], 1),
+                     np.stack([w, h], 1), np.stack([zeros, h], 1)], axis=1)
+
+
+def homographies_batch(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    Solve the 3x3 homography mapping each src quad onto its dst quad, like
+    cv2.getPerspectiveTransform but for (N, 4, 2) arrays in one batched solve.
+    """
+    src = src.astype(np.float64)
+    dst = dst.astype(np.float64)
+    n = src.shape[0]
+    x, y = src[:, :, 0], src[:, :, 1]
+    u, v = dst[:, :, 0], dst[:, :, 1]
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    A = np.empty((n, 8, 8))
+    A[:, :4] = np.stack([x, y, ones, zeros, zeros, zeros, -x * u, -y * u], axis=2)
+    A[:, 4:] = np.stack([zeros, zeros, zeros, x, y, ones, -x * v, -y * v], axis=2)
+    b = np.concatenate([u, v], axis=1)
+    h = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+    return np.concatenate([h, np.ones((n, 1))], axis=1).reshape(n, 3, 3)
+
+
+def project_points_batch(H: np.ndarray, pts: np.ndarray) -> np.ndarray:
+    """Apply one homography per row: (N, 3, 3) x (N, 2) -> (N, 2)."""
+    homog = np.einsum("nij,nj->ni", H, np.concatenate([pts, np.ones((len(pts), 1))], axis=1))
+    return homog[:, :2] / homog[:, 2:]
+
+
+def centers_from_homographies_batch(M: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """Back-project the center of each warped output through the inverse of its homography."""
+    return project_points_batch(np.linalg.inv(M), sizes / 2.0)
+
+
+def quad_metrics_batch(quads: np.ndarray) -> dict:
+    """
+    Ordered corners, warp output sizes, top-edge angles, homographies and back-projected
+    centers for an (N, 4, 2) array of quads, computed in one vectorized pass.
+    Centers are truncated to int like processing.calculate_center_from_homography.
+    """
+    rects = order_points_batch(quads)
+    sizes = quad_sizes_batch(rects)
+    angles = quad_angles_batch(rects)
+    # Solve for the inverse map directly rather than inverting each forward matrix
+    M_inv = homographies_batch(warp_targets_batch(sizes), rects)
+    centers = project_points_batch(M_inv, sizes / 2.0).astype(np.int64)
+    return {
+        "rects": rects,
+        "sizes": sizes,
+        "angles": angles,
+        "M": np.linalg.inv(M_inv),
+        "centers": centers,
+    }
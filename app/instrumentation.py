@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class RollingHistogram:
+    """
+    Keeps the last size samples of a stage in a ring buffer. Adding a sample is O(1);
+    percentiles are only computed when a summary is requested. Safe to add from several threads.
+    """
+    def __init__(self, size: int = 1024):
+        self.samples = np.zeros(size)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self.samples[self.count % len(self.samples)] = value
+            self.count += 1
+
+    def window(self) -> np.ndarray:
+        """Copy of the samples currently in the window."""
+        with self._lock:
+            return self.samples[:min(self.count, len(self.samples))].copy()
+
+    def percentiles(self, qs=(50, 95, 99)) -> np.ndarray:
+        window = self.window()
+        if not len(window):
+            return np.full(len(qs), np.nan)
+        return np.percentile(window, qs)
+
+
+class _Timer:
+    """Context manager recording the elapsed time of a block under a stage name."""
+    __slots__ = ("instruments", "stage", "start")
+
+    def __init__(self, instruments: "Instrumentation", stage: str):
+        self.instruments = instruments
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.instruments.record(self.stage, time.perf_counter() - self.start)
+
+
+class Instrumentation:
+    """
+    Per-stage latency histograms for the vision-to-servo loop.
+    Cheap enough to leave on: a timer is two perf_counter calls and a ring buffer write.
+
+        with INSTRUMENTS.timer("decode"):
+            img = cv2.imdecode(...)
+        INSTRUMENTS.record("glass_to_servo", time.perf_counter() - frame_received)
+    """
+    def __init__(self, window: int = 1024, enabled: bool = True):
+        self.window = window
+        self.enabled = enabled
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self._reporter: Optional[threading.Thread] = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms.setdefault(stage, RollingHistogram(self.window))
+        histogram.add(seconds)
+
+    def timer(self, stage: str) -> _Timer:
+        return _Timer(self, stage)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """p50/p95/p99 in milliseconds and total sample count for every stage."""
+        out = {}
+        for stage, histogram in list(self.histograms.items()):
+            p50, p95, p99 = 1000 * histogram.percentiles()
+            out[stage] = {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "count": histogram.count}
+        return out
+
+    def format_summary(self) -> str:
+        lines = []
+        for stage, s in self.summary().items():
+            lines.append(f"{stage:>22}: p50 {s['p50_ms']:7.2f} ms  p95 {s['p95_ms']:7.2f} ms  "
+                         f"p99 {s['p99_ms']:7.2f} ms  (n={s['count']})")
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> None:
+        """Write the current summary as JSON."""
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def start_reporter(self, interval: float = 10.0) -> None:
+        """Print a summary every interval seconds from a daemon thread."""
+        if self._reporter is not None:
+            return
+
+        def report():
+            while True:
+                time.sleep(interval)
+                if self.histograms:
+                    print(self.format_summary())
+
+        self._reporter = threading.Thread(target=report, daemon=True)
+        self._reporter.start()
+
+    def reset(self) -> None:
+        self.histograms.clear()
+
+
+# Shared instance used by processing.py, wifi.py and app.py
+INSTRUMENTS = Instrumentation()
@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LatestQueue:
+    """
+    Bounded queue with a "latest frame wins" drop policy.
+    When the queue is full, the oldest item is discarded to make room for the new one,
+    so a slow consumer always picks up the freshest frame instead of a backlog.
+    on_drop, if given, is called for every discarded item.
+    """
+    def __init__(self, maxsize: int = 1, on_drop: Optional[Callable[[], None]] = None):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item: Any) -> None:
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Block until an item is available. Raises queue.Empty on timeout."""
+        return self._queue.get(timeout=timeout)
+
+
+class StageStats:
+    """Throughput and busy-time counters for a single pipeline stage."""
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, error: bool = False) -> None:
+        with self._lock:
+            self.count += 1
+            self.busy += elapsed
+            if error:
+                self.errors += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            wall = time.perf_counter() - self.started
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "fps": self.count / wall if wall > 0 else 0.0,
+                "avg_ms": 1000 * self.busy / self.count if self.count else 0.0,
+                "utilization": self.busy / wall if wall > 0 else 0.0,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.count = 0
+            self.errors = 0
+            self.busy = 0.0
+            self.started = time.perf_counter()
+
+
+class Stage(threading.Thread):
+    """
+    Worker thread that pulls items from an inbox, applies fn and fans the result out to every outbox.
+    If inbox is None the stage is a source and fn is called with no arguments.
+    Returning None from fn drops the item; raising StopIteration from a source stops the pipeline.
+    """
+    def __init__(self, name: str, fn: Callable, inbox: Optional[LatestQueue],
+                 outboxes: List[LatestQueue], stop_event: threading.Event, poll: float = 0.1):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outboxes = outboxes
+        self.stop_event = stop_event
+        self.poll = poll
+        self.stats = StageStats(name)
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            if self.inbox is None:
+                args = ()
+            else:
+                try:
+                    args = (self.inbox.get(timeout=self.poll),)
+                except queue.Empty:
+                    continue
+
+            start = time.perf_counter()
+            try:
+                result = self.fn(*args)
+            except StopIteration:
+                self.stop_event.set()
+                break
+            except Exception as e:
+                self.stats.record(time.perf_counter() - start, error=True)
+                print(f"{self.name} stage error: {e}")
+                continue
+            self.stats.record(time.perf_counter() - start)
+
+            if result is None:
+                continue
+            for outbox in self.outboxes:
+                outbox.put(result)
+
+
+class Pipeline:
+    """
+    A chain of Stage threads connected by LatestQueues.
+    Stages are started in order and share a single stop event.
+    """
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.stages: List[Stage] = []
+        self.queues: Dict[str, LatestQueue] = {}
+        self.stats: Dict[str, StageStats] = {}
+
+    def queue(self, name: str, maxsize: int = 1) -> LatestQueue:
+        """Create (or return) a named queue between stages."""
+        if name not in self.queues:
+            self.queues[name] = LatestQueue(maxsize)
+        return self.queues[name]
+
+    def add_stage(self, name: str, fn: Callable, inbox: Optional[LatestQueue] = None,
+                  outboxes: Optional[List[LatestQueue]] = None) -> Stage:
+        stage = Stage(name, fn, inbox, outboxes or [], self.stop_event)
+        self.stages.append(stage)
+        self.stats[name] = stage.stats
+        return stage
+
+    def track(self, name: str) -> StageStats:
+        """Register stats for a stage that runs outside the pipeline threads (e.g. display on the main thread)."""
+        self.stats[name] = StageStats(name)
+        return self.stats[name]
+
+    def start(self) -> None:
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self.stop_event.set()
+        for stage in self.stages:
+            if stage.is_alive():
+                stage.join(timeout)
+
+    def report(self, reset: bool = False) -> str:
+        """Return a one-line throughput summary for every stage and queue."""
+        parts = []
+        for name, stats in self.stats.items():
+            s = stats.snapshot()
+            parts.append(f"{name}: {s['fps']:.1f} fps, {s['avg_ms']:.1f} ms, "
+                         f"{100 * s['utilization']:.0f}% busy")
+            if reset:
+                stats.reset()
+        drops = ", ".join(f"{name}={q.dropped}" for name, q in self.queues.items())
+        return " | ".join(parts) + f" | dropped: {drops}"
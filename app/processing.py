@@ -1,36 +1,194 @@
+import time
+
 import cv2
 import numpy as np
-from typing import Tuple, Optional
+from functools import cached_property
+from typing import TYPE_CHECKING, Tuple, Optional
+
+from instrumentation import INSTRUMENTS
+from geometry import quad_sizes_batch, quad_angles_batch, centers_from_homographies_batch
+
+if TYPE_CHECKING:
+    from display import DisplaySink
+
+# Adjusted HSV range; you might need to tweak these values
+HSV_LOWER = np.array([0, 0, 150], np.uint8)
+HSV_UPPER = np.array([180, 60, 255], np.uint8)
+MORPH_KERNEL = np.ones((3, 3), np.uint8)  # experiment with kernel size
+# Smallest contour area (in full-resolution pixels) accepted as the notebook
+MIN_NOTEBOOK_AREA = 1000
+
+class FrameWorkspace:
+    """
+    Preallocated output buffers for the preprocess hot path, sized to the stream resolution.
+    Buffers are passed as dst to the OpenCV calls so steady-state frames allocate nothing.
+    allocations counts every buffer (re)allocation, including any OpenCV had to make
+    because a dst didn't match; it should stop growing after the first frame.
+    """
+    def __init__(self, shape: Optional[Tuple[int, ...]] = None):
+        self.shape = None
+        self.allocations = 0
+        self.frames = 0
+        if shape is not None:
+            self.ensure(shape)
+
+    def ensure(self, shape: Tuple[int, ...]) -> None:
+        """(Re)allocate the buffers if the frame shape changed."""
+        if self.shape == shape:
+            return
+        h, w = shape[:2]
+        self.shape = shape
+        self.blurred = np.empty((h, w, 3), np.uint8)
+        self.hsv = np.empty((h, w, 3), np.uint8)
+        self.mask = np.empty((h, w), np.uint8)
+        self.scratch = np.empty((h, w), np.uint8)
+        self.gray = np.empty((h, w), np.uint8)
+        self.canvas = np.empty((h, w, 3), np.uint8)
+        self.channels = [np.empty((h, w), np.uint8) for _ in range(3)]
+        self.vmax = np.empty((h, w), np.uint8)
+        self.vmin = np.empty((h, w), np.uint8)
+        self.bound = np.empty((h, w), np.uint8)
+        self.allocations += 12
+
+    def check(self, out: np.ndarray, buf: np.ndarray) -> np.ndarray:
+        """Count an allocation if OpenCV returned a new array instead of writing into buf."""
+        if out is not buf:
+            self.allocations += 1
+        return out
+
+    def copy_to_canvas(self, image: np.ndarray) -> np.ndarray:
+        """Copy a frame into the reusable drawing canvas."""
+        self.ensure(image.shape)
+        np.copyto(self.canvas, image)
+        return self.canvas
+
+class HsvThreshold:
+    """
+    cv2.inRange on the HSV image, computed from per-pixel max/min(B, G, R) and lookup tables when the
+    bounds accept every hue (S and V only depend on max and min). Bounds that restrict hue fall back
+    to the HSV conversion.
+    """
+    def __init__(self, lower: np.ndarray = HSV_LOWER, upper: np.ndarray = HSV_UPPER):
+        self.lower = None
+        self.upper = None
+        self.builds = 0
+        self.set_bounds(lower, upper)
+
+    def set_bounds(self, lower: np.ndarray, upper: np.ndarray) -> None:
+        lower, upper = np.array(lower, np.uint8), np.array(upper, np.uint8)
+        if np.array_equal(lower, self.lower) and np.array_equal(upper, self.upper):
+            return
+        self.lower, self.upper = lower, upper
+        # 8-bit hue runs 0-179
+        self.hue_free = lower[0] == 0 and upper[0] >= 179
+        if self.hue_free:
+            self._build_tables()
+
+    def _build_tables(self) -> None:
+        vmax, vmin = np.meshgrid(np.arange(256), np.arange(256), indexing="ij")
+        # B = max and G = R = min: any pixel with that max and min has the same S and V
+        pairs = np.dstack([vmax, vmin, vmin]).astype(np.uint8)
+        passing = (cv2.inRange(cv2.cvtColor(pairs, cv2.COLOR_BGR2HSV), self.lower, self.upper) > 0) & (vmin <= vmax)
+        found = passing.any(axis=1)
+        first = np.where(found, passing.argmax(axis=1), 255)
+        last = np.where(found, 255 - passing[:, ::-1].argmax(axis=1), 0)
+        if np.any(found & (passing.sum(axis=1) != last - first + 1)):
+            # Not a single range per max; can't happen for S/V bounds, but stay correct regardless
+            self.hue_free = False
+            return
+        self.min_table = first.astype(np.uint8)
+        self.max_table = last.astype(np.uint8)
+        # The upper bound only matters if it ever excludes a min <= max (a minimum saturation, or
+        # V bounds that exclude max = 255, where the 255 in min_table would otherwise pass)
+        self.needs_max = bool(np.any(found & (last < np.arange(256)))) or not found[255]
+        self.builds += 1
+
+    def apply(self, image: np.ndarray, workspace: Optional[FrameWorkspace] = None) -> np.ndarray:
+        """Return the 0/255 mask of pixels within the bounds, in workspace.scratch if given."""
+        if not self.hue_free:
+            if workspace is None:
+                return cv2.inRange(cv2.cvtColor(image, cv2.COLOR_BGR2HSV), self.lower, self.upper)
+            ws = workspace
+            ws.check(cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=ws.hsv), ws.hsv)
+            return ws.check(cv2.inRange(ws.hsv, self.lower, self.upper, dst=ws.scratch), ws.scratch)
+
+        if workspace is None:
+            # Reuse the split channels as scratch so only four planes are allocated
+            b, g, r = cv2.split(image)
+            vmax = cv2.max(b, g)
+            cv2.max(vmax, r, dst=vmax)
+            vmin = cv2.min(b, g, dst=b)
+            cv2.min(vmin, r, dst=vmin)
+            bound, mask = g, r
+        else:
+            ws = workspace
+            b, g, r = cv2.split(image, ws.channels)
+            vmax, vmin, bound, mask = ws.vmax, ws.vmin, ws.bound, ws.scratch
+            cv2.max(b, g, dst=vmax)
+            cv2.max(vmax, r, dst=vmax)
+            cv2.min(b, g, dst=vmin)
+            cv2.min(vmin, r, dst=vmin)
+
+        cv2.LUT(vmax, self.min_table, dst=bound)
+        cv2.compare(vmin, bound, cv2.CMP_GE, dst=mask)
+        if self.needs_max:
+            cv2.LUT(vmax, self.max_table, dst=bound)
+            cv2.compare(vmin, bound, cv2.CMP_LE, dst=bound)
+            cv2.bitwise_and(mask, bound, dst=mask)
+        return mask
 
-def preprocess(image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+# The white paper threshold used when no other is given; pass your own HsvThreshold to retune it
+PAPER_THRESHOLD = HsvThreshold(HSV_LOWER, HSV_UPPER)
+
+def preprocess(image: np.ndarray, workspace: Optional[FrameWorkspace] = None,
+               with_gray: bool = True, threshold: Optional[HsvThreshold] = None) -> Tuple[Optional[np.ndarray], np.ndarray]:
     """
     Improved preprocessing to detect white/light colored paper.
+    If a workspace is given, every intermediate is written into its preallocated buffers.
+    with_gray=False skips the grayscale conversion and returns None in its place.
+    threshold defaults to PAPER_THRESHOLD.
     """
+    if threshold is None:
+        threshold = PAPER_THRESHOLD
+    if workspace is not None:
+        return _preprocess_into(image, workspace, with_gray, threshold)
+
     # Optionally apply a blur to reduce noise
     blurred = cv2.GaussianBlur(image, (5, 5), 0)
     
-    # Convert to HSV color space
-    hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-    
-    # Adjusted HSV range; you might need to tweak these values
-    lower = np.array([0, 0, 150])
-    upper = np.array([180, 60, 255])
-    
-    # Create mask for white/light regions
-    mask = cv2.inRange(hsv, lower, upper)
+    # Create mask for white/light regions (HSV bounds, via lookup tables)
+    mask = threshold.apply(blurred)
     
     # Clean up the mask with morphological operations
-    kernel = np.ones((3, 3), np.uint8)  # experiment with kernel size
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL)
     
     # For debugging, you can show the HSV channels:
+    # hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
     # cv2.imshow("Hue", hsv[:,:,0])
     # cv2.imshow("Saturation", hsv[:,:,1])
     # cv2.imshow("Value", hsv[:,:,2])
     
+    if not with_gray:
+        return None, mask
     return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), mask
 
+def _preprocess_into(image: np.ndarray, ws: FrameWorkspace, with_gray: bool = True,
+                     threshold: HsvThreshold = PAPER_THRESHOLD) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """Same as preprocess, but writing into the workspace buffers."""
+    ws.ensure(image.shape)
+    ws.frames += 1
+    ws.check(cv2.GaussianBlur(image, (5, 5), 0, dst=ws.blurred), ws.blurred)
+    threshold.apply(ws.blurred, ws)
+    ws.check(cv2.morphologyEx(ws.scratch, cv2.MORPH_CLOSE, MORPH_KERNEL, dst=ws.mask), ws.mask)
+    ws.check(cv2.morphologyEx(ws.mask, cv2.MORPH_OPEN, MORPH_KERNEL, dst=ws.scratch), ws.scratch)
+    # Swap so the final mask lives in ws.mask and scratch is free for the next frame
+    ws.mask, ws.scratch = ws.scratch, ws.mask
+    if not with_gray:
+        return None, ws.mask
+    ws.check(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=ws.gray), ws.gray)
+    return ws.gray, ws.mask
+
 
 def detect_edges(image: np.ndarray, low_threshold: int = 50, high_threshold: int = 150) -> np.ndarray:
     """
@@ -42,22 +200,24 @@ def detect_edges(image: np.ndarray, low_threshold: int = 50, high_threshold: int
 def order_points(pts: np.ndarray) -> np.ndarray:
     """
     Order points in the order: top-left, top-right, bottom-right, bottom-left.
+    With more than 4 points (e.g. a convex hull), the corners are the extremes of x+y and y-x.
     """
-    # Ensure pts is a (4,2) array.
-    pts = pts.reshape(4, 2)
+    pts = pts.reshape(-1, 2)
+    if len(pts) < 4:
+        raise ValueError(f"Need at least 4 points to order, got {len(pts)}")
     rect = np.zeros((4, 2), dtype="float32")
     s = pts.sum(axis=1)
     rect[0] = pts[np.argmin(s)]
     rect[2] = pts[np.argmax(s)]
-    
+
     diff = np.diff(pts, axis=1)
     rect[1] = pts[np.argmin(diff)]
     rect[3] = pts[np.argmax(diff)]
     return rect
 
-def transform_perspective(image: np.ndarray, contour: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+def quad_corners(contour: np.ndarray) -> np.ndarray:
     """
-    Perform perspective transform and return warped image, the transformation matrix, and the rotation angle.
+    Return the ordered (4, 2) corners of a contour: top-left, top-right, bottom-right, bottom-left.
     """
     pts = contour.reshape(-1, 2)
     # If the contour doesn't contain exactly 4 points, fall back to a bounding rectangle.
@@ -65,17 +225,15 @@ def transform_perspective(image: np.ndarray, contour: np.ndarray) -> Tuple[np.nd
         print('falling back: contour has {} points instead of 4'.format(pts.shape[0]))
         x, y, w, h = cv2.boundingRect(contour)
         pts = np.array([[x, y], [x+w, y], [x+w, y+h], [x, y+h]], dtype="float32")
-    
-    rect = order_points(pts)
-    (tl, tr, br, bl) = rect
-
-    widthA = np.linalg.norm(br - bl)
-    widthB = np.linalg.norm(tr - tl)
-    maxWidth = int(max(widthA, widthB))
+    return order_points(pts)
 
-    heightA = np.linalg.norm(tr - br)
-    heightB = np.linalg.norm(tl - bl)
-    maxHeight = int(max(heightA, heightB))
+def perspective_params(contour: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int], float]:
+    """
+    Compute the perspective transform for a quad without warping anything.
+    Returns the transformation matrix, the (width, height) of the warped output, and the rotation angle.
+    """
+    rect = quad_corners(contour)
+    maxWidth, maxHeight = (int(v) for v in quad_sizes_batch(rect[None])[0])
 
     dst = np.array([
         [0, 0],
@@ -85,16 +243,31 @@ def transform_perspective(image: np.ndarray, contour: np.ndarray) -> Tuple[np.nd
     ], dtype="float32")
 
     M = cv2.getPerspectiveTransform(rect, dst)
+
+    # Calculate rotation angle based on top edge
+    angle = quad_angles_batch(rect[None])[0]
+    return M, (maxWidth, maxHeight), angle
+
+def warp_perspective(image: np.ndarray, M: np.ndarray, size: Tuple[int, int], angle: float) -> np.ndarray:
+    """
+    Warp the image with a transform from perspective_params and undo the rotation of the top edge.
+    """
+    maxWidth, maxHeight = size
     warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
     warped = cv2.convertScaleAbs(warped) 
     
-    # Calculate rotation angle based on top edge
-    angle = np.degrees(np.arctan2(tr[1]-tl[1], tr[0]-tl[0]))
     if abs(angle) > 1:
         center_pt = (maxWidth // 2, maxHeight // 2)
         R = cv2.getRotationMatrix2D(center_pt, angle, 1.0)
         warped = cv2.warpAffine(warped, R, (maxWidth, maxHeight))
-    return warped, M, angle
+    return warped
+
+def transform_perspective(image: np.ndarray, contour: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Perform perspective transform and return warped image, the transformation matrix, and the rotation angle.
+    """
+    M, size, angle = perspective_params(contour)
+    return warp_perspective(image, M, size, angle), M, angle
 
 def calculate_center(contour: np.ndarray) -> Tuple[int, int]:
     """
@@ -114,22 +287,28 @@ def calculate_center_using_warp(warped: np.ndarray, M: np.ndarray) -> Tuple[int,
       2. Transform it back to the original image coordinates using the inverse warp.
     """
     h, w = warped.shape[:2]
-    warped_center = np.array([[[w/2, h/2]]], dtype="float32")
-    M_inv = np.linalg.inv(M)
-    original_center = cv2.perspectiveTransform(warped_center, M_inv)
-    center = (int(original_center[0][0][0]), int(original_center[0][0][1]))
+    return calculate_center_from_homography(M, (w, h))
+
+def calculate_center_from_homography(M: np.ndarray, size: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Same as calculate_center_using_warp, but computed analytically from the warped
+    output size so the warp itself never has to run.
+    """
+    original_center = centers_from_homographies_batch(M[None], np.array([size], dtype=np.float64))[0]
+    center = (int(original_center[0]), int(original_center[1]))
     return center
 
-def segment_notebook(thresh: np.ndarray) -> Optional[np.ndarray]:
+def segment_notebook(thresh: np.ndarray, min_area: float = MIN_NOTEBOOK_AREA) -> Optional[np.ndarray]:
     """
     Enhanced segmentation to approximate a quadrilateral (trapezoid) that fits the paper tightly.
+    min_area is in pixels of thresh, so scale it down with the mask.
     """
     # Find contours in the binary mask
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
         return None
     largest = max(contours, key=cv2.contourArea)
-    if cv2.contourArea(largest) < 1000:
+    if cv2.contourArea(largest) < min_area:
         return None
     peri = cv2.arcLength(largest, True)
     approx = cv2.approxPolyDP(largest, 0.02 * peri, True)
@@ -144,6 +323,122 @@ def segment_notebook(thresh: np.ndarray) -> Optional[np.ndarray]:
             return rect.reshape((4, 1, 2))
     return approx
 
+def refine_corners(image: np.ndarray, corners: np.ndarray, window: int = 5) -> np.ndarray:
+    """
+    Refine approximate corner locations to sub-pixel accuracy.
+    Only a small grayscale patch around each corner is converted, so the cost doesn't grow with image size.
+    """
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.05)
+    h, w = image.shape[:2]
+    # Leave room for the search window plus the gradient border cornerSubPix needs
+    half = 2 * window + 2
+    refined = corners.reshape(-1, 2).astype(np.float32).copy()
+    for i, (cx, cy) in enumerate(refined):
+        x0, y0 = max(int(cx) - half, 0), max(int(cy) - half, 0)
+        x1, y1 = min(int(cx) + half + 1, w), min(int(cy) + half + 1, h)
+        if x1 - x0 <= 2 * window + 5 or y1 - y0 <= 2 * window + 5:
+            continue
+        patch = image[y0:y1, x0:x1]
+        if patch.ndim == 3:
+            patch = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+        pt = np.array([[[cx - x0, cy - y0]]], dtype=np.float32)
+        cv2.cornerSubPix(patch, pt, (window, window), (-1, -1), criteria)
+        # Ignore refinements that wandered off the corner
+        if abs(pt[0, 0, 0] - (cx - x0)) <= window and abs(pt[0, 0, 1] - (cy - y0)) <= window:
+            refined[i] = pt[0, 0] + (x0, y0)
+    return refined.reshape(-1, 1, 2)
+
+def segment_downscaled(image: np.ndarray, scale: float = 0.5, window: int = 5,
+                       threshold: Optional[HsvThreshold] = None) -> Optional[np.ndarray]:
+    """
+    Segment the notebook on a downscaled copy of the image, then map the corners back
+    to full resolution and refine them locally. Returns float32 corners or None.
+    """
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, thresh = preprocess(small, with_gray=False, threshold=threshold)
+    contour = segment_notebook(thresh, MIN_NOTEBOOK_AREA * scale ** 2)
+    if contour is None:
+        return None
+    corners = contour.reshape(-1, 1, 2).astype(np.float32) / scale
+    if len(corners) != 4:
+        return corners
+    # Coarse corners can be off by a couple of downscaled pixels, so widen the search to match
+    return refine_corners(image, corners, max(window, int(np.ceil(2 / scale))))
+
+class NotebookTracker:
+    """
+    Stateful wrapper around preprocess/segment_notebook that reuses the previous quad.
+    Each frame is first searched only inside a padded region around the last detected contour;
+    if that fails (or the quad touches the region border) it falls back to a full-frame search.
+    min_area is in pixels of the images it is given (see analyze_jpeg for reduced decodes).
+    """
+    def __init__(self, padding: float = 0.25, min_padding: int = 20, min_area: float = MIN_NOTEBOOK_AREA):
+        self.padding = padding
+        self.min_padding = min_padding
+        self.min_area = min_area
+        self.last_contour: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+        self.full_searches = 0
+        self.lost = 0
+
+    def reset(self) -> None:
+        """Forget the last contour so the next frame does a full-frame search."""
+        self.last_contour = None
+
+    def roi(self, shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+        """Return the padded search region (x0, y0, x1, y1) around the last contour, clipped to the image."""
+        x, y, w, h = cv2.boundingRect(self.last_contour.astype(np.int32))
+        pad = max(self.min_padding, int(self.padding * max(w, h)))
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        x1, y1 = min(x + w + pad, shape[1]), min(y + h + pad, shape[0])
+        return x0, y0, x1, y1
+
+    def _search_roi(self, image: np.ndarray, threshold: Optional[HsvThreshold]) -> Optional[np.ndarray]:
+        x0, y0, x1, y1 = self.roi(image.shape)
+        if x1 - x0 <= 0 or y1 - y0 <= 0:
+            return None
+        _, thresh = preprocess(image[y0:y1, x0:x1], with_gray=False, threshold=threshold)
+        contour = segment_notebook(thresh, self.min_area)
+        if contour is None:
+            return None
+
+        # A quad touching an inner edge of the region was probably clipped, so don't trust it
+        x, y, w, h = cv2.boundingRect(contour.astype(np.int32))
+        if (x <= 1 and x0 > 0) or (y <= 1 and y0 > 0) or \
+           (x + w >= x1 - x0 - 1 and x1 < image.shape[1]) or (y + h >= y1 - y0 - 1 and y1 < image.shape[0]):
+            return None
+        return contour + np.array([x0, y0], dtype=contour.dtype)
+
+    def segment(self, image: np.ndarray, threshold: Optional[HsvThreshold] = None) -> Optional[np.ndarray]:
+        """Find the notebook quad in full-image coordinates, or None if it can't be found."""
+        if self.last_contour is not None:
+            contour = self._search_roi(image, threshold)
+            if contour is not None:
+                self.hits += 1
+                self.last_contour = contour
+                return contour
+            self.misses += 1
+
+        self.full_searches += 1
+        _, thresh = preprocess(image, with_gray=False, threshold=threshold)
+        contour = segment_notebook(thresh, self.min_area)
+        if contour is None:
+            self.lost += 1
+        self.last_contour = contour
+        return contour
+
+    def stats(self) -> dict:
+        """Hit/miss statistics for the ROI search."""
+        attempts = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "full_searches": self.full_searches,
+            "lost": self.lost,
+            "hit_rate": self.hits / attempts if attempts else 0.0,
+        }
+
 def draw_bounding_box(image: np.ndarray, contour: np.ndarray) -> np.ndarray:
     """
     Draw the notebook contour as a bounding box on the image.
@@ -185,31 +480,177 @@ def show_debug_window(name: str, image: np.ndarray, wait: bool = False) -> None:
     if wait:
         cv2.waitKey(0)
 
-def process_image(image: np.ndarray, debug: bool = True, show: bool=False) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int], float]:
+class ProcessResult:
     """
-    Runs through the complete pipeline with optional debug visualization using threshold-based segmentation.
+    Result of analyze_image. contour, center and angle are computed eagerly; the warped
+    view and the grayscale image are only computed on first access, so a control loop
+    that never displays them never pays for the warp.
+    captured is the perf_counter time the frame was captured or received, if known; hand it on
+    with the command this result produces (ServoCommandScheduler.submit) to measure glass-to-servo latency.
     """
-    # Grayscale and threshold
-    gray, thresh = preprocess(image)
-    if debug:
-        show_debug_window("3. Threshold", thresh)
-    
-    # Use threshold segmentation instead of edge-based contour detection
-    contour = segment_notebook(thresh)
+    def __init__(self, image: np.ndarray, contour: np.ndarray, corners: np.ndarray,
+                 captured: Optional[float] = None):
+        self.image = image
+        self.captured = captured
+        self._set_geometry(contour, corners)
+
+    def _set_geometry(self, contour: np.ndarray, corners: np.ndarray) -> None:
+        self.contour = contour
+        self.corners = corners
+        self.rect = quad_corners(corners)
+        self.M, self.size, self.angle = perspective_params(self.rect)
+        self.center = calculate_center_from_homography(self.M, self.size)
+
+    @cached_property
+    def warped(self) -> np.ndarray:
+        with INSTRUMENTS.timer("transform_perspective"):
+            return warp_perspective(self.image, self.M, self.size, self.angle)
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+
+    def __iter__(self):
+        """Unpack like process_image: contour, warped, center, angle."""
+        return iter((self.contour, self.warped, self.center, self.angle))
+
+class JpegFrame:
+    """
+    A received JPEG, decoded lazily. reduced is a 1/reduction size colour decode, which libjpeg
+    produces by skipping most of the IDCT work, and is enough for segmentation. full is only
+    decoded if something asks for it, e.g. a display or the warped view.
+    Holds a reference to data, which must stay valid while the frame is used; pass bytes,
+    not a view into a reused receive buffer, if the frame or its results outlive the next read.
+    An empty or corrupt payload decodes to None. captured is the frame's arrival time, if known.
+    """
+    REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                     4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+    def __init__(self, data, reduction: int = 2, captured: Optional[float] = None):
+        if reduction not in self.REDUCED_FLAGS:
+            raise ValueError(f"reduction must be one of {sorted(self.REDUCED_FLAGS)}")
+        self.data = data
+        self.reduction = reduction
+        self.captured = captured
+
+    @cached_property
+    def reduced(self) -> Optional[np.ndarray]:
+        if self.reduction == 1 or not len(self.data):
+            return self.full
+        with INSTRUMENTS.timer("imdecode_reduced"):
+            return cv2.imdecode(np.frombuffer(self.data, np.uint8), self.REDUCED_FLAGS[self.reduction])
+
+    @cached_property
+    def full(self) -> Optional[np.ndarray]:
+        if not len(self.data):
+            return None
+        with INSTRUMENTS.timer("imdecode"):
+            return cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+
+class JpegProcessResult(ProcessResult):
+    """
+    ProcessResult of a JpegFrame tracked on its reduced decode. Geometry is in full-resolution
+    coordinates; image (and so warped and gray) triggers the full decode on first access.
+    """
+    def __init__(self, frame: JpegFrame, contour: np.ndarray, corners: np.ndarray):
+        self.frame = frame
+        self.captured = frame.captured
+        self._set_geometry(contour, corners)
+
+    @cached_property
+    def image(self) -> np.ndarray:
+        if self.frame.full is None:
+            raise RuntimeError("Failed to decode frame")
+        return self.frame.full
+
+def _segment(image: np.ndarray, debug: bool, tracker: Optional[NotebookTracker], scale: float,
+             workspace: Optional[FrameWorkspace], min_area: float = MIN_NOTEBOOK_AREA,
+             threshold: Optional[HsvThreshold] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the notebook, returning (integer contour, corners to warp from)."""
+    if tracker is not None and scale < 1.0:
+        raise ValueError("tracker and scale < 1 can't be combined; the tracker searches at full resolution")
+    corners = None
+    if tracker is not None:
+        with INSTRUMENTS.timer("track"):
+            contour = tracker.segment(image, threshold)
+    elif scale < 1.0:
+        with INSTRUMENTS.timer("segment_downscaled"):
+            corners = segment_downscaled(image, scale, threshold=threshold)
+        # Keep the sub-pixel corners for the warp, but hand back an integer contour for drawing
+        contour = None if corners is None else np.round(corners).astype(np.int32)
+    else:
+        # Threshold only, the grayscale image is computed lazily if anyone asks for it
+        with INSTRUMENTS.timer("preprocess"):
+            _, thresh = preprocess(image, workspace, with_gray=False, threshold=threshold)
+        if debug:
+            show_debug_window("3. Threshold", thresh)
+
+        # Use threshold segmentation instead of edge-based contour detection
+        with INSTRUMENTS.timer("segment_notebook"):
+            contour = segment_notebook(thresh, min_area)
     if contour is None:
         raise RuntimeError("Notebook segmentation failed")
-    
+    return contour, contour if corners is None else corners
+
+def analyze_image(image: np.ndarray, debug: bool = False,
+                  tracker: Optional[NotebookTracker] = None, scale: float = 1.0,
+                  workspace: Optional[FrameWorkspace] = None, captured: Optional[float] = None,
+                  threshold: Optional[HsvThreshold] = None) -> ProcessResult:
+    """
+    Segment the notebook and return a ProcessResult with lazily computed warped/grayscale views.
+    captured (the frame's capture time) is passed through to the result. threshold is the
+    paper threshold to segment with (PAPER_THRESHOLD by default), e.g. a ThresholdCalibrator's.
+    If a tracker is given, segmentation is restricted to the region around the previous detection.
+    Otherwise a scale below 1 segments on a downscaled image and refines the corners at full resolution
+    (passing both raises ValueError).
+    A workspace makes full-frame preprocessing reuse preallocated buffers.
+    The image is referenced, not copied, so draw on it only after reading any lazy fields you need.
+    """
+    contour, corners = _segment(image, debug, tracker, scale, workspace, threshold=threshold)
+    with INSTRUMENTS.timer("perspective"):
+        return ProcessResult(image, contour, corners, captured)
+
+def analyze_jpeg(frame: JpegFrame, debug: bool = False, tracker: Optional[NotebookTracker] = None,
+                 workspace: Optional[FrameWorkspace] = None, threshold: Optional[HsvThreshold] = None) -> JpegProcessResult:
+    """
+    analyze_image for a received JPEG: segments on the reduced decode and scales the result back
+    to full-resolution coordinates, so the controller sees the same pixels as before.
+    The full frame is only decoded if the result's image, warped or gray view is read.
+    A tracker must always be used with the same reduction, and its min_area scaled to match,
+    e.g. NotebookTracker(min_area=MIN_NOTEBOOK_AREA / reduction ** 2).
+    """
+    if frame.reduced is None:
+        raise RuntimeError("Failed to decode frame")
+    r = frame.reduction
+    contour, corners = _segment(frame.reduced, debug, tracker, 1.0, workspace, MIN_NOTEBOOK_AREA / r ** 2, threshold)
+    if len(corners) == 4:
+        # Sub-pixel corners on the reduced image recover most of the precision lost to the reduction
+        corners = refine_corners(frame.reduced, corners, 3)
+    # Pixel centres: reduced pixel i covers full-resolution pixels [r*i, r*i + r)
+    corners = (corners.astype(np.float32) + 0.5) * r - 0.5
+    with INSTRUMENTS.timer("perspective"):
+        return JpegProcessResult(frame, np.round(corners).astype(np.int32), corners)
+
+def process_image(image: np.ndarray, debug: bool = True, show: bool=False,
+                  tracker: Optional[NotebookTracker] = None, scale: float = 1.0,
+                  workspace: Optional[FrameWorkspace] = None) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int], float]:
+    """
+    Runs through the complete pipeline with optional debug visualization using threshold-based segmentation.
+    See analyze_image for tracker, scale and workspace; a workspace also backs the show overlay.
+    """
+    start = time.perf_counter()
+    analysis = analyze_image(image, debug, tracker, scale, workspace)
+    contour, center, angle = analysis.contour, analysis.center, analysis.angle
+
     # Perspective transform using the segmented bounding box contour
-    warped, M, angle = transform_perspective(image, contour)
+    warped = analysis.warped
+    INSTRUMENTS.record("process_image", time.perf_counter() - start)
 
     if debug:
         show_debug_window("5. Warped Perspective", warped)
-    
-    # Calculate center using the rotated tight box contour
-    center = calculate_center_using_warp(warped, M)
 
     if show: 
-        result = image.copy()
+        result = image.copy() if workspace is None else workspace.copy_to_canvas(image)
         cv2.drawContours(result, [contour], -1, (0, 255, 0), 2)
         cv2.circle(result, center, 10, (0, 0, 255), -1)
         cv2.putText(result, f"Center: {center}", (10, 30),
@@ -218,12 +659,17 @@ def process_image(image: np.ndarray, debug: bool = True, show: bool=False) -> Tu
 
     return contour, warped, center, angle
 
-def capture_continuous(camera_index: int = 0, process_frame=None) -> None:
+def capture_continuous(camera_index: int = 0, process_frame=None, sink: Optional["DisplaySink"] = None) -> None:
     """
     Continuously capture and process frames from the camera (or video file).
     process_frame: optional callback function to process each frame.
+    sink: where frames are shown, a HighGUI window by default.
     """
     cap = cv2.VideoCapture("new_paper.MOV")
+    if sink is None:
+        # Only the interactive loop needs HighGUI; the rest of this module stays UI-free
+        from display import WindowSink
+        sink = WindowSink()
 
     try:
         while True:
@@ -231,6 +677,7 @@ def capture_continuous(camera_index: int = 0, process_frame=None) -> None:
             if not ret:
                 continue
 
+            keep_going = True
             if process_frame:
                 try:
                     contour, warped, center, angle = process_frame(frame)
@@ -239,18 +686,18 @@ def capture_continuous(camera_index: int = 0, process_frame=None) -> None:
                     cv2.circle(frame, center, 10, (0, 0, 255), -1)
                     cv2.putText(frame, f"Angle: {angle:.1f}", (10, 30), 
                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    # Show warped view alongside main view
-                    cv2.imshow("Warped View", warped)
+                    # Show warped view alongside main view; a quit key seen here counts too
+                    keep_going = sink.show("Warped View", warped)
                 except Exception as e:
                     print(f"Frame processing error: {e}")
 
-            cv2.imshow("Tracking (Press 'q' to quit)", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            keep_going = sink.show("Tracking (Press 'q' to quit)", frame) and keep_going
+            if not keep_going:
                 break
 
     finally:
         cap.release()
-        cv2.destroyAllWindows()
+        sink.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,136 @@
+import struct
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Text protocol (default): "CMD:<angle1>,<angle2>\n"
+# Sending MODE_BINARY switches the link to fixed-size binary command frames until it disconnects.
+MODE_BINARY = b"MODE:BIN\n"
+
+# Binary command frame, 8 bytes little endian:
+#   magic (0xA5), flags, angle1 (int16), angle2 (int16), sequence number, XOR checksum of the first 7 bytes
+CMD_MAGIC = 0xA5
+CMD_FLAG_ACK = 0x01
+CMD_STRUCT = struct.Struct("<BBhhBB")
+
+# Acks travel camera -> host inside the frame stream as a 4-byte "<I" header that can never
+# be a real frame size: 0xA6 in the top byte, then a status-specific byte, then status, then
+# sequence number. ACK_CONFIG acks use that byte for the largest FRAME_SIZES index the camera
+# supports (the firmware clamps larger requests, e.g. to QVGA without PSRAM).
+ACK_MARKER = 0xA6
+ACK_OK = 0x00
+ACK_BAD_CHECKSUM = 0x01
+ACK_MODE_BINARY = 0x02
+ACK_CONFIG = 0x03
+
+# Stream settings: "CFG:<frame size>,<jpeg quality>,<frame interval ms>\n" in text mode, or in binary
+# mode an 8-byte frame laid out like a command frame:
+#   magic (0xA7), flags, frame size index, jpeg quality, interval ms (uint16), sequence number, XOR checksum
+# The frame size is an index into FRAME_SIZES (the FRAME_SIZES table in glasses/esp32.cpp);
+# JPEG quality follows the camera driver, 0-63 where lower is better.
+CFG_MAGIC = 0xA7
+CFG_STRUCT = struct.Struct("<BBBBHBB")
+FRAME_SIZES = ((160, 120), (320, 240), (400, 296), (640, 480), (800, 600))
+
+
+def checksum(data: bytes) -> int:
+    """XOR of all bytes."""
+    value = 0
+    for b in data:
+        value ^= b
+    return value
+
+
+def encode_text_command(angle1: int, angle2: int) -> bytes:
+    return f"CMD:{angle1},{angle2}\n".encode("utf-8")
+
+
+def encode_binary_command(angle1: int, angle2: int, seq: int, ack: bool = False) -> bytes:
+    body = CMD_STRUCT.pack(CMD_MAGIC, CMD_FLAG_ACK if ack else 0, angle1, angle2, seq & 0xFF, 0)[:-1]
+    return body + bytes([checksum(body)])
+
+
+def decode_binary_command(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """Return (angle1, angle2, seq, flags), or None if the frame is malformed."""
+    if len(data) != CMD_STRUCT.size or data[0] != CMD_MAGIC or checksum(data[:-1]) != data[-1]:
+        return None
+    _, flags, angle1, angle2, seq, _ = CMD_STRUCT.unpack(data)
+    return angle1, angle2, seq, flags
+
+
+def encode_text_config(frame_size: int, quality: int, interval_ms: int) -> bytes:
+    return f"CFG:{frame_size},{quality},{interval_ms}\n".encode("utf-8")
+
+
+def encode_binary_config(frame_size: int, quality: int, interval_ms: int, seq: int, ack: bool = False) -> bytes:
+    body = CFG_STRUCT.pack(CFG_MAGIC, CMD_FLAG_ACK if ack else 0, frame_size, quality, interval_ms, seq & 0xFF, 0)[:-1]
+    return body + bytes([checksum(body)])
+
+
+def decode_binary_config(data: bytes) -> Optional[Tuple[int, int, int, int, int]]:
+    """Return (frame_size, quality, interval_ms, seq, flags), or None if the frame is malformed."""
+    if len(data) != CFG_STRUCT.size or data[0] != CFG_MAGIC or checksum(data[:-1]) != data[-1]:
+        return None
+    _, flags, frame_size, quality, interval_ms, seq, _ = CFG_STRUCT.unpack(data)
+    return frame_size, quality, interval_ms, seq, flags
+
+
+def is_ack(header_value: int) -> bool:
+    """True if a "<I" frame header is actually a compact ack."""
+    return header_value >> 24 == ACK_MARKER
+
+
+def decode_ack(header_value: int) -> Tuple[int, int]:
+    """Return (seq, status) from an ack header."""
+    return header_value & 0xFF, (header_value >> 8) & 0xFF
+
+
+def ack_payload(header_value: int) -> int:
+    """The status-specific byte of an ack header, e.g. the largest frame size for ACK_CONFIG."""
+    return (header_value >> 16) & 0xFF
+
+
+def encode_ack(seq: int, status: int, payload: int = 0) -> bytes:
+    return struct.pack("<I", (ACK_MARKER << 24) | ((payload & 0xFF) << 16) | ((status & 0xFF) << 8) | (seq & 0xFF))
+
+
+class BinaryCommandEncoder:
+    """
+    Encodes binary servo commands and stream settings with a shared wrapping sequence number.
+    Safe to share between threads (e.g. a servo scheduler and the stream settings controller).
+    With ack=True the camera acks every frame; pass those acks to handle_ack, which clears
+    them from pending (sequence number -> send time).
+    """
+    def __init__(self, ack: bool = False):
+        self.ack = ack
+        self.seq = 0
+        self.acked = 0
+        self.rejected = 0
+        self.last_ack: Optional[Tuple[int, int]] = None
+        self.pending: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def _next_seq(self) -> int:
+        with self._lock:
+            seq = self.seq
+            self.seq = (seq + 1) & 0xFF
+            if self.ack:
+                self.pending[seq] = time.perf_counter()
+            return seq
+
+    def encode(self, angle1: int, angle2: int) -> bytes:
+        return encode_binary_command(angle1, angle2, self._next_seq(), self.ack)
+
+    def encode_config(self, frame_size: int, quality: int, interval_ms: int) -> bytes:
+        return encode_binary_config(frame_size, quality, interval_ms, self._next_seq(), self.ack)
+
+    def handle_ack(self, seq: int, status: int) -> None:
+        """Record an ack (from decode_ack) for a frame this encoder produced."""
+        with self._lock:
+            self.last_ack = (seq, status)
+            self.pending.pop(seq, None)
+        if status == ACK_BAD_CHECKSUM:
+            self.rejected += 1
+            print(f"ESP32 rejected binary frame seq={seq} (bad checksum)")
+        else:
+            self.acked += 1
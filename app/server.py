@@ -1,20 +1,75 @@
-from flask import Flask, send_file
-from PIL import Image
-import io
+from flask import Flask, Response, request, jsonify
+import cv2
+import threading
+from delta import DeltaBroadcaster, WIRE_VERSION as DELTA_WIRE_VERSION
+from display import mjpeg_stream
+from frame_cache import EncodedFrameCache
+from processing import analyze_image, NotebookTracker
 
 app = Flask(__name__)
 
+# Latest warped notebook views, pre-encoded per variant. Each processed frame is encoded
+# at most once per variant, on first request, and the same bytes are served to every client.
+warped_frames = EncodedFrameCache(max_bytes=8 * 1024 * 1024)
+# Tile deltas of the same view for the phone link, encoded once per frame while anyone is subscribed
+warped_deltas = DeltaBroadcaster()
+
+def run_processing(source: str = "new_paper.MOV") -> None:
+    """Capture and process frames, publishing the warped notebook view for the HTTP clients."""
+    cap = cv2.VideoCapture(source)
+    tracker = NotebookTracker()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            try:
+                warped = analyze_image(frame, tracker=tracker).warped
+                warped_frames.publish(warped)
+                warped_deltas.publish(warped)
+            except Exception as e:
+                print(f"Frame processing error: {e}")
+    finally:
+        cap.release()
+
 @app.route('/image', methods=['GET'])
 def get_image():
-    # Create a simple colored image
-    img = Image.new('RGB', (100, 100), color='red')
-    
-    # Save it to a bytes buffer
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
-    
-    return send_file(img_io, mimetype='image/png')
+    # Latest warped view; ?variant=full|low|thumb|png selects size and format.
+    # Polling clients send If-None-Match and get a 304 without anything being encoded.
+    variant = request.args.get('variant', 'full')
+    if variant not in warped_frames.variants:
+        return Response(f"Unknown variant {variant}", status=400)
+    if warped_frames.version and request.if_none_match.contains(warped_frames.etag(variant)):
+        return Response(status=304, headers={'ETag': f'"{warped_frames.etag(variant)}"'})
+
+    version, data = warped_frames.get(variant)
+    if data is None:
+        return Response("No frame processed yet", status=503)
+    response = Response(data, mimetype=warped_frames.variants[variant].mimetype,
+                        headers={'X-Frame-Version': str(version), 'Cache-Control': 'no-cache'})
+    response.set_etag(warped_frames.etag(variant, version))
+    return response
+
+@app.route('/stream', methods=['GET'])
+def get_stream():
+    # Multipart MJPEG stream; each client only receives frames newer than the last one it got
+    return Response(mjpeg_stream(warped_frames), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/delta', methods=['GET'])
+def get_delta_stream():
+    # Length-prefixed tile delta messages (wire format in delta.py), starting with a keyframe
+    return Response(warped_deltas.subscribe(), mimetype='application/octet-stream',
+                    headers={'X-Delta-Version': str(DELTA_WIRE_VERSION)})
+
+@app.route('/cache', methods=['GET'])
+def get_cache_stats():
+    stats = warped_frames.stats()
+    encoder = warped_deltas.encoder
+    stats.update(delta_subscribers=warped_deltas.subscribers, delta_tiles_sent=encoder.tiles_sent,
+                 delta_tiles_skipped=encoder.tiles_skipped)
+    return jsonify(stats)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    threading.Thread(target=run_processing, daemon=True).start()
+    # The reloader would start a second processing thread in the child process
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False, threaded=True)
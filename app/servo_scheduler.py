@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from instrumentation import INSTRUMENTS
+
+
+def _oldest(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    """The earlier of two optional timestamps."""
+    if a is None or b is None:
+        return b if a is None else a
+    return min(a, b)
+
+
+class ServoCommandScheduler:
+    """
+    Sends servo commands from a background thread so the vision loop never blocks on the link.
+
+    submit() only records the latest target. The sender thread wakes up at most max_rate
+    times per second and sends whatever is pending, so a burst of commands between two
+    sends is coalesced into one. No-op commands are suppressed:
+      - relative=True (Controller steps): deltas are accumulated and a zero total is never sent.
+      - relative=False (absolute angles): the latest target wins and a repeat of the last sent
+        command is not sent again.
+
+    send_fn is called as send_fn(angle1, angle2), e.g.
+        lambda a1, a2: send_servo_command(sock, a1, a2, verbose=False)
+    and should raise if the command could not be sent. A failed command is kept pending (merged
+    with anything newer) and retried, with the interval doubling per consecutive failure up to max_backoff.
+
+    submit() takes the capture time of the frame a command was computed from (ProcessResult.captured);
+    once that command is actually sent, the time since is recorded as "glass_to_servo" latency.
+    A coalesced relative command keeps the oldest capture time it contains.
+    """
+    def __init__(self, send_fn: Callable[[int, int], None], max_rate: float = 20.0, relative: bool = True,
+                 max_backoff: float = 2.0):
+        self.send_fn = send_fn
+        self.min_interval = 1.0 / max_rate
+        self.max_backoff = max_backoff
+        self.relative = relative
+        self.submitted = 0
+        self.sent = 0
+        self.suppressed = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._consecutive_errors = 0
+        self._pending: Optional[Tuple[int, int]] = None
+        self._pending_captured: Optional[float] = None
+        self._last_sent: Optional[Tuple[int, int]] = None
+        self._last_send_time = 0.0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ServoCommandScheduler":
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush: bool = True) -> None:
+        """Stop the sender thread, optionally sending whatever is still pending first."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            self._send_pending()
+
+    def __enter__(self) -> "ServoCommandScheduler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def submit(self, angle1: int, angle2: int, captured: Optional[float] = None) -> None:
+        """Record a new target without blocking. captured is the capture time of its frame, if any."""
+        with self._cond:
+            self.submitted += 1
+            if self._pending is not None:
+                self.coalesced += 1
+                if self.relative:
+                    angle1 += self._pending[0]
+                    angle2 += self._pending[1]
+                    captured = _oldest(self._pending_captured, captured)
+            self._pending = (angle1, angle2)
+            self._pending_captured = captured
+            self._cond.notify()
+
+    def _take(self) -> Optional[Tuple[Tuple[int, int], Optional[float]]]:
+        """Pop the pending command and its capture time, or None if it is a no-op. Must hold the lock."""
+        command, self._pending = self._pending, None
+        if command is None:
+            return None
+        if (self.relative and command == (0, 0)) or (not self.relative and command == self._last_sent):
+            self.suppressed += 1
+            return None
+        return command, self._pending_captured
+
+    def _send(self, command: Tuple[int, int], captured: Optional[float] = None) -> None:
+        try:
+            self.send_fn(*command)
+            self.sent += 1
+            self._last_sent = command
+            self._consecutive_errors = 0
+            if captured is not None:
+                INSTRUMENTS.record("glass_to_servo", time.perf_counter() - captured)
+        except Exception as e:
+            self.errors += 1
+            self._consecutive_errors += 1
+            print(f"Error sending servo command: {e}")
+            with self._cond:
+                # Retry unless a newer absolute target replaced it; relative steps must not be lost
+                if self._pending is None:
+                    self._pending = command
+                    self._pending_captured = captured
+                elif self.relative:
+                    self._pending = (self._pending[0] + command[0], self._pending[1] + command[1])
+                    self._pending_captured = _oldest(self._pending_captured, captured)
+        self._last_send_time = time.perf_counter()
+
+    def _interval(self) -> float:
+        """Time between sends: min_interval, doubled per consecutive failure up to max_backoff."""
+        if not self._consecutive_errors:
+            return self.min_interval
+        backoff = self.min_interval * 2 ** min(self._consecutive_errors, 16)
+        return max(min(backoff, self.max_backoff), self.min_interval)
+
+    def _send_pending(self) -> None:
+        with self._cond:
+            taken = self._take()
+        if taken is not None:
+            self._send(*taken)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            # Rate limit; anything submitted while we wait is coalesced into this send
+            wait = self._last_send_time + self._interval() - time.perf_counter()
+            if wait > 0:
+                with self._cond:
+                    # Wake early only to stop
+                    self._cond.wait_for(lambda: not self._running, wait)
+            self._send_pending()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
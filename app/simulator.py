@@ -0,0 +1,350 @@
+"""
+Local stand-in for the ESP32-CAM, for testing wifi.py, bluetooth.py and the control loop without hardware.
+
+Replays recorded frames as "<I" length-prefixed JPEGs and accepts the same servo commands as the
+firmware: "CMD:<a1>,<a2>" lines, "MODE:BIN" and binary command frames with acks (see protocol.py).
+Every command is logged with its arrival time and the age of the newest frame sent before it,
+which bounds glass-to-servo latency from below.
+
+    python simulator.py --source new_paper.MOV --fps 15 --jitter 0.01 --loss 0.05 --log commands.csv
+    python simulator.py --source frames/ --pty        # prints the device to use as bluetooth.SERIAL_PORT
+"""
+import argparse
+import csv
+import glob
+import os
+import select
+import socket
+import struct
+import threading
+import time
+import tty
+from typing import Callable, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from protocol import (ACK_BAD_CHECKSUM, ACK_CONFIG, ACK_MODE_BINARY, ACK_OK, CFG_MAGIC, CMD_FLAG_ACK,
+                      CMD_MAGIC, CMD_STRUCT, FRAME_SIZES, MODE_BINARY, decode_binary_command,
+                      decode_binary_config, encode_ack)
+
+
+def load_frames(source: str, max_frames: int = 300, quality: int = 24,
+                size: Optional[tuple] = (320, 240)) -> List[bytes]:
+    """
+    Load frames as JPEG bytes from a video file, a directory of images, or "synthetic"
+    (benchmark scenes). Frames are re-encoded at the camera's resolution and quality
+    (QVGA, quality 24 in glasses/esp32.cpp) so payload sizes match the real link.
+    """
+    images = []
+    if source == "synthetic":
+        from benchmark import render_scene
+        rng = np.random.default_rng(0)
+        width, height = size or (320, 240)
+        images = [render_scene(width, height, rng, noise=4.0)[0] for _ in range(min(max_frames, 60))]
+    elif os.path.isdir(source):
+        for path in sorted(glob.glob(os.path.join(source, "*")))[:max_frames]:
+            image = cv2.imread(path)
+            if image is not None:
+                images.append(image)
+    else:
+        cap = cv2.VideoCapture(source)
+        while len(images) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            images.append(frame)
+        cap.release()
+    if not images:
+        raise RuntimeError(f"No frames could be loaded from {source}")
+
+    frames = []
+    for image in images:
+        if size is not None and image.shape[1::-1] != tuple(size):
+            image = cv2.resize(image, tuple(size), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            frames.append(buf.tobytes())
+    return frames
+
+
+class CommandRecord(NamedTuple):
+    time: float          # perf_counter when the command was parsed
+    frame: int           # number of the newest frame sent before it, -1 if none
+    frame_age: float     # seconds since that frame was written, NaN if none
+    angle1: int
+    angle2: int
+    mode: str            # "text" or "binary"
+
+
+class Esp32Simulator:
+    """
+    Serves one client connection at a time, like the firmware. A sender thread writes frames
+    at fps with uniform +/- jitter seconds of timing noise; each frame is dropped with
+    probability loss, as if lost on the link (dropping whole frames keeps the length-prefixed
+    stream in sync, which is what the real transports guarantee). The calling thread parses
+    commands until the client disconnects. Stream settings ("CFG:") change the frame rate;
+    frame size and quality are only logged in configs, since the recorded frames are fixed.
+    Frame sizes are clamped to max_frame_size, which config acks report like the firmware
+    (len(FRAME_SIZES) - 1 with PSRAM, 1 without).
+    """
+    def __init__(self, frames: List[bytes], fps: float = 10.0, jitter: float = 0.0, loss: float = 0.0,
+                 loop: bool = True, seed: Optional[int] = None, verbose: bool = False,
+                 max_frame_size: int = len(FRAME_SIZES) - 1):
+        self.frames = frames
+        self.max_frame_size = max_frame_size
+        self.fps = fps
+        self.jitter = jitter
+        self.loss = loss
+        self.loop = loop
+        self.verbose = verbose
+        self.rng = np.random.default_rng(seed)
+        self.commands: List[CommandRecord] = []
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bad_commands = 0
+        self.configs: List[tuple] = []
+        self.binary_mode = False
+        self._last_frame = (-1, float("nan"))
+        self._write_lock = threading.Lock()
+
+    def _send_frames(self, write: Callable[[bytes], None], stop: threading.Event) -> None:
+        index = 0
+        next_time = time.perf_counter()
+        while not stop.is_set():
+            if index >= len(self.frames):
+                if not self.loop:
+                    break
+                index = 0
+            frame = self.frames[index]
+            index += 1
+
+            next_time += 1.0 / self.fps
+            delay = next_time + self.rng.uniform(-self.jitter, self.jitter) - time.perf_counter()
+            if delay > 0:
+                stop.wait(delay)
+            if self.rng.random() < self.loss:
+                self.frames_dropped += 1
+                continue
+            try:
+                with self._write_lock:
+                    write(struct.pack("<I", len(frame)) + frame)
+            except OSError:
+                break
+            self._last_frame = (self.frames_sent, time.perf_counter())
+            self.frames_sent += 1
+        stop.set()
+
+    def _send_ack(self, write: Callable[[bytes], None], seq: int, status: int) -> None:
+        payload = self.max_frame_size if status == ACK_CONFIG else 0
+        with self._write_lock:
+            write(encode_ack(seq, status, payload))
+
+    def _log_command(self, angle1: int, angle2: int, mode: str) -> None:
+        now = time.perf_counter()
+        frame, sent = self._last_frame
+        self.commands.append(CommandRecord(now, frame, now - sent, angle1, angle2, mode))
+        if self.verbose:
+            print(f"Servo command {angle1},{angle2} ({mode}), {1000 * (now - sent):.1f} ms after frame {frame}")
+
+    def _apply_config(self, frame_size: int, quality: int, interval_ms: int) -> None:
+        frame_size = min(max(frame_size, 0), self.max_frame_size)
+        self.configs.append((time.perf_counter(), frame_size, quality, interval_ms))
+        self.fps = 1000.0 / max(interval_ms, 1)
+        if self.verbose:
+            print(f"Stream settings: frame size {frame_size}, quality {quality}, interval {interval_ms} ms")
+
+    def _handle_input(self, buffer: bytearray, write: Callable[[bytes], None]) -> None:
+        """Consume every complete command in buffer, leaving any partial one."""
+        while buffer:
+            if self.binary_mode:
+                # Resynchronise on the magic byte, like processBinaryCommands()
+                if buffer[0] not in (CMD_MAGIC, CFG_MAGIC):
+                    del buffer[0]
+                    continue
+                if len(buffer) < CMD_STRUCT.size:
+                    return
+                data = bytes(buffer[:CMD_STRUCT.size])
+                del buffer[:CMD_STRUCT.size]
+                flags, seq = data[1], data[6]
+                if data[0] == CFG_MAGIC:
+                    config = decode_binary_config(data)
+                    if config is None:
+                        self.bad_commands += 1
+                        if flags & CMD_FLAG_ACK:
+                            self._send_ack(write, seq, ACK_BAD_CHECKSUM)
+                        continue
+                    self._apply_config(*config[:3])
+                    if flags & CMD_FLAG_ACK:
+                        self._send_ack(write, seq, ACK_CONFIG)
+                    continue
+                command = decode_binary_command(data)
+                if command is None:
+                    self.bad_commands += 1
+                    if flags & CMD_FLAG_ACK:
+                        self._send_ack(write, seq, ACK_BAD_CHECKSUM)
+                    continue
+                self._log_command(command[0], command[1], "binary")
+                if flags & CMD_FLAG_ACK:
+                    self._send_ack(write, seq, ACK_OK)
+                continue
+
+            end = buffer.find(b"\n")
+            if end < 0:
+                return
+            line = bytes(buffer[:end + 1]).strip()
+            del buffer[:end + 1]
+            if line == MODE_BINARY.strip():
+                self.binary_mode = True
+                self._send_ack(write, 0, ACK_MODE_BINARY)
+                continue
+            if line.startswith(b"CFG:"):
+                try:
+                    self._apply_config(*(int(v) for v in line[4:].split(b",")))
+                except (TypeError, ValueError):
+                    self.bad_commands += 1
+                    continue
+                self._send_ack(write, 0, ACK_CONFIG)
+                continue
+            if not line.startswith(b"CMD:"):
+                continue
+            try:
+                angle1, angle2 = (int(v) for v in line[4:].split(b","))
+            except ValueError:
+                self.bad_commands += 1
+                continue
+            # The firmware also echoes "GPIO14: ..." text here, which the host side cannot parse
+            # inside the frame stream; the stand-in leaves it out.
+            self._log_command(angle1, angle2, "text")
+
+    def serve(self, read: Callable[[int], bytes], write: Callable[[bytes], None]) -> None:
+        """Run one session over a byte stream until the client disconnects or the frames run out."""
+        self.binary_mode = False
+        stop = threading.Event()
+        sender = threading.Thread(target=self._send_frames, args=(write, stop), daemon=True)
+        sender.start()
+        buffer = bytearray()
+        try:
+            while not stop.is_set():
+                try:
+                    data = read(4096)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+                if not data:
+                    break
+                buffer += data
+                self._handle_input(buffer, write)
+        finally:
+            stop.set()
+            sender.join()
+
+    def serve_tcp(self, host: str = "0.0.0.0", port: int = 1234, sessions: Optional[int] = None) -> None:
+        """Accept clients on host:port one after another, like the WiFi firmware."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        print(f"Simulated ESP32 listening on {host}:{server.getsockname()[1]}")
+        served = 0
+        try:
+            while sessions is None or served < sessions:
+                conn, address = server.accept()
+                print(f"Client connected from {address[0]}:{address[1]}")
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+                def read(n: int, conn=conn) -> bytes:
+                    # Poll like serve_pty; a socket timeout would also cut off a slow reader in sendall
+                    if not select.select([conn], [], [], 0.5)[0]:
+                        raise BlockingIOError
+                    return conn.recv(n)
+
+                try:
+                    self.serve(read, conn.sendall)
+                finally:
+                    conn.close()
+                    served += 1
+                    print("Client disconnected")
+        finally:
+            server.close()
+
+    def serve_pty(self) -> None:
+        """Serve over a pseudo-terminal pair, standing in for the Bluetooth serial port."""
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        print(f"Simulated ESP32 serial port at {os.ttyname(slave)}")
+
+        def read(n: int) -> bytes:
+            # Poll so serve() still notices when the frames run out
+            if not select.select([master], [], [], 0.5)[0]:
+                raise BlockingIOError
+            return os.read(master, n)
+
+        def write(data: bytes) -> None:
+            view = memoryview(data)
+            while len(view):
+                view = view[os.write(master, view):]
+
+        try:
+            # The port stays open between clients, so serve until interrupted
+            self.serve(read, write)
+        finally:
+            os.close(master)
+            os.close(slave)
+
+    def summary(self) -> dict:
+        ages = np.array([c.frame_age for c in self.commands if c.frame >= 0])
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "commands": len(self.commands),
+            "bad_commands": self.bad_commands,
+            "frame_age_ms_p50": float(np.percentile(ages, 50) * 1000) if len(ages) else float("nan"),
+            "frame_age_ms_p95": float(np.percentile(ages, 95) * 1000) if len(ages) else float("nan"),
+        }
+
+    def save_log(self, path: str) -> None:
+        """Write the command log as CSV."""
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CommandRecord._fields)
+            writer.writerows(self.commands)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded frames as a simulated ESP32-CAM")
+    parser.add_argument("--source", default="synthetic", help="video file, image directory or 'synthetic'")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform frame timing noise in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping each frame")
+    parser.add_argument("--once", action="store_true", help="stop after one pass instead of looping")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--pty", action="store_true", help="serve over a pty instead of TCP")
+    parser.add_argument("--log", help="write received servo commands to this CSV file")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-psram", action="store_true", help="only allow frame sizes up to QVGA, like the firmware without PSRAM")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.max_frames)
+    print(f"Loaded {len(frames)} frames, {sum(map(len, frames)) / len(frames) / 1024:.1f} KiB average")
+    simulator = Esp32Simulator(frames, args.fps, args.jitter, args.loss, not args.once, args.seed, args.verbose,
+                               1 if args.no_psram else len(FRAME_SIZES) - 1)
+    try:
+        if args.pty:
+            simulator.serve_pty()
+        else:
+            simulator.serve_tcp(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(simulator.summary())
+        if args.log:
+            simulator.save_log(args.log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import glob
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_STAGES = ("capture", "process", "control")
+
+
+def telemetry_dtype(stages: Sequence[str] = DEFAULT_STAGES) -> np.dtype:
+    """Record layout: one row per processed frame, stage timings in seconds."""
+    return np.dtype([
+        ("timestamp", "f8"),
+        ("center", "i4", (2,)),
+        ("angle", "f4"),
+        ("corners", "f4", (4, 2)),
+        ("servo", "i2", (2,)),
+        ("timings", "f4", (len(stages),)),
+    ])
+
+
+class TelemetryRecorder:
+    """
+    Buffers per-frame records in a preallocated structured array and writes full chunks
+    as .npy files from a background thread, so the hot loop never touches the filesystem.
+    Each recorder is one session: its chunks are named telemetry_<n>.npy inside its own
+    subdirectory of directory (timestamp and pid by default); read them back with load_telemetry.
+    """
+    def __init__(self, directory: str = "telemetry", chunk_size: int = 1024,
+                 stages: Sequence[str] = DEFAULT_STAGES, session: Optional[str] = None):
+        self.session = session or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.directory = os.path.join(directory, self.session)
+        self.chunk_size = chunk_size
+        self.stages = tuple(stages)
+        self.dtype = telemetry_dtype(self.stages)
+        os.makedirs(self.directory, exist_ok=True)
+        self._chunk_index = len(glob.glob(os.path.join(self.directory, "telemetry_*.npy")))
+        self._buffer = np.zeros(chunk_size, self.dtype)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_chunks, daemon=True)
+        self._writer.start()
+        self.records = 0
+        self.chunks_written = 0
+
+    def record(self, center: Tuple[int, int], angle: float, corners: np.ndarray,
+               servo: Tuple[int, int], timings: Optional[Dict[str, float]] = None,
+               timestamp: Optional[float] = None) -> None:
+        """Append one frame. timings maps stage names to seconds; unknown stages are ignored."""
+        with self._lock:
+            row = self._buffer[self._count]
+            row["timestamp"] = time.time() if timestamp is None else timestamp
+            row["center"] = center
+            row["angle"] = angle
+            row["corners"] = np.asarray(corners).reshape(4, 2)
+            row["servo"] = servo
+            if timings:
+                row["timings"] = [timings.get(stage, np.nan) for stage in self.stages]
+            else:
+                row["timings"] = np.nan
+            self._count += 1
+            self.records += 1
+            if self._count == self.chunk_size:
+                self._hand_off()
+
+    def _hand_off(self) -> None:
+        """Queue the current buffer for writing and start a fresh one. Must hold the lock."""
+        self._queue.put((self._chunk_index, self._buffer[:self._count]))
+        self._chunk_index += 1
+        self._buffer = np.zeros(self.chunk_size, self.dtype)
+        self._count = 0
+
+    def flush(self) -> None:
+        """Queue whatever is buffered, even if the chunk isn't full."""
+        with self._lock:
+            if self._count:
+                self._hand_off()
+
+    def close(self) -> None:
+        """Flush and wait for the writer thread to finish."""
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+
+    def __enter__(self) -> "TelemetryRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _write_chunks(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, chunk = item
+            try:
+                np.save(os.path.join(self.directory, f"telemetry_{index:05d}.npy"), chunk)
+                self.chunks_written += 1
+            except Exception as e:
+                print(f"Failed to write telemetry chunk {index}: {e}")
+
+
+def list_sessions(directory: str = "telemetry") -> List[str]:
+    """Recorded sessions in directory, least recently written first."""
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    return [os.path.basename(path) for path in sorted(filter(os.path.isdir, paths), key=os.path.getmtime)]
+
+
+def load_telemetry(directory: str = "telemetry", session: Optional[str] = None) -> np.ndarray:
+    """Load and concatenate the chunks of one session (the latest by default), in recording order."""
+    if session is None:
+        sessions = list_sessions(directory)
+        if not sessions:
+            return np.zeros(0, telemetry_dtype())
+        session = sessions[-1]
+    paths = sorted(glob.glob(os.path.join(directory, session, "telemetry_*.npy")))
+    if not paths:
+        return np.zeros(0, telemetry_dtype())
+    return np.concatenate([np.load(path) for path in paths])
+
+
+def export_servo_angles(records: np.ndarray, path: str) -> None:
+    """Write the commanded servo angles in the old servo_angles.txt format ("a1, a2" per line)."""
+    with open(path, "w") as file:
+        for a1, a2 in records["servo"]:
+            file.write(f"{a1}, {a2}\n")
+
+
+if __name__ == "__main__":
+    import sys
+
+    sessions = list_sessions()
+    session = sys.argv[1] if len(sys.argv) > 1 else (sessions[-1] if sessions else None)
+    if session is None:
+        print("No telemetry sessions recorded")
+    else:
+        records = load_telemetry(session=session)
+        print(f"Session {session}: {len(records)} records")
+        if len(records):
+            export_servo_angles(records, os.path.join("telemetry", session, "servo_angles.txt"))
@@ -3,6 +3,15 @@ import struct
 import cv2
 import numpy as np
 import threading
+from instrumentation import INSTRUMENTS
+from display import DisplaySink, WindowSink
+from processing import JpegFrame
+from pipeline import LatestQueue, Stage
+from servo_scheduler import ServoCommandScheduler
+from protocol import (MODE_BINARY, ACK_CONFIG, ACK_MODE_BINARY, FRAME_SIZES, BinaryCommandEncoder,
+                      encode_text_command, encode_text_config, is_ack, decode_ack, ack_payload)
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
 
 # Update with your ESP32's IP address and port (must match your ESP32 sketch)
 ESP32_IP = "192.168.2.74"  # Replace with your ESP32 IP address
@@ -21,60 +30,373 @@ def init_socket(ip: str, port: int) -> socket.socket:
 
 def recvall(sock, count):
     """Helper function to receive exactly 'count' bytes from the socket."""
-    buf = b""
-    while count:
-        newbuf = sock.recv(count)
-        if not newbuf:
+    buf = bytearray(count)
+    view = memoryview(buf)
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
             return None
-        buf += newbuf
-        count -= len(newbuf)
+        view = view[n:]
     return buf
 
-def receive_images(sock):
-    """Continuously receive JPEG frames from the ESP32 and display them."""
+class FrameReceiver:
+    """
+    Reads "<I" length-prefixed JPEG frames into a reusable preallocated buffer with recv_into,
+    and decodes straight from that buffer. The buffer only grows when a larger frame arrives.
+    Tracks received bytes and frames so bytes/sec and frames/sec can be reported.
+    Compact acks from the binary command protocol are consumed here and never returned as frames;
+    once binary mode is confirmed, set encoder so acks for its commands are passed on to it.
+    on_config_ack is called with the largest frame size the camera reported in a stream settings ack.
+    """
+    def __init__(self, sock, initial_size: int = 64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+        self._header = bytearray(4)
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.started = time.perf_counter()
+        self.last_frame_time = None
+        self.acks = 0
+        self.last_ack: Optional[Tuple[int, int]] = None
+        self.binary_confirmed = threading.Event()
+        self.encoder: Optional[BinaryCommandEncoder] = None
+        self.on_config_ack: Optional[Callable[[int], None]] = None
+
+    def _recv_into(self, view: memoryview) -> bool:
+        """Fill the whole view from the socket. Returns False if the connection closed."""
+        while len(view):
+            n = self.sock.recv_into(view)
+            if n == 0:
+                return False
+            view = view[n:]
+        return True
+
+    def read_frame(self) -> Optional[memoryview]:
+        """Read the next frame and return a view into the shared buffer, valid until the next call."""
+        while True:
+            if not self._recv_into(memoryview(self._header)):
+                return None
+            frame_size = struct.unpack("<I", self._header)[0]
+            if not is_ack(frame_size):
+                break
+            self._handle_ack(frame_size)
+        if frame_size > len(self.buffer):
+            self.buffer = bytearray(max(frame_size, 2 * len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        frame = self.view[:frame_size]
+        start = time.perf_counter()
+        if not self._recv_into(frame):
+            return None
+        # Arrival time of the frame, for glass-to-servo latency
+        self.last_frame_time = time.perf_counter()
+        INSTRUMENTS.record("recv", self.last_frame_time - start)
+        self.bytes_received += frame_size + 4
+        self.frames_received += 1
+        return frame
+
+    def _handle_ack(self, header_value: int) -> None:
+        self.acks += 1
+        self.bytes_received += 4
+        self.last_ack = decode_ack(header_value)
+        if self.last_ack[1] == ACK_MODE_BINARY:
+            self.binary_confirmed.set()
+            return
+        if self.last_ack[1] == ACK_CONFIG and self.on_config_ack is not None:
+            self.on_config_ack(ack_payload(header_value))
+        if self.encoder is not None:
+            self.encoder.handle_ack(*self.last_ack)
+
+    def read_image(self, flags: int = cv2.IMREAD_COLOR) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Read and decode the next frame. Returns (ok, image) where ok is False once the
+        connection closed and image is None if the JPEG failed to decode.
+        """
+        frame = self.read_frame()
+        if frame is None:
+            return False, None
+        if not len(frame):
+            return True, None
+        with INSTRUMENTS.timer("imdecode"):
+            return True, cv2.imdecode(np.frombuffer(frame, np.uint8), flags)
+
+    def rates(self) -> Tuple[float, float]:
+        """Return (bytes/sec, frames/sec) since the receiver was created or last reset."""
+        elapsed = time.perf_counter() - self.started
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return self.bytes_received / elapsed, self.frames_received / elapsed
+
+    def reset_rates(self) -> None:
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.started = time.perf_counter()
+
+class StreamSettings(NamedTuple):
+    """Camera stream settings: index into protocol.FRAME_SIZES, JPEG quality (0-63, lower is better), frame interval."""
+    frame_size: int
+    quality: int
+    interval_ms: int
+
+    def describe(self) -> str:
+        width, height = FRAME_SIZES[self.frame_size]
+        return f"{width}x{height} q{self.quality} @ {1000 / max(self.interval_ms, 1):.0f} fps"
+
+
+# Cheapest to most expensive; each step costs the link and the host more than the one before
+DEFAULT_LADDER = (
+    StreamSettings(0, 30, 200),
+    StreamSettings(1, 30, 100),
+    StreamSettings(1, 24, 66),
+    StreamSettings(1, 16, 50),
+    StreamSettings(2, 16, 50),
+    StreamSettings(3, 16, 66),
+    StreamSettings(3, 12, 50),
+)
+
+
+class AdaptiveStreamController:
+    """
+    Picks the best camera settings the link and the host can sustain and sends changes to the ESP32.
+
+    Every interval seconds it compares the measured frame rate with the rate the current settings
+    ask for, and the host's utilization: the busiest stage's time spent handling frames / wall time
+    (stages on different threads overlap, so they are not added up), plus frames dropped by a
+    "latest wins" pipeline. Falling short on either steps down the ladder at once; a run of healthy
+    intervals steps up one level. If an upgrade fails straight away, the number of healthy intervals
+    needed before the next attempt doubles, so the link does not oscillate between two levels.
+    Levels above the largest frame size the camera reports (set_max_frame_size) are never used.
+    """
+    def __init__(self, send_config: Callable[[StreamSettings], None], ladder: Sequence[StreamSettings] = DEFAULT_LADDER,
+                 level: int = 2, interval: float = 2.0, min_rate: float = 0.8, max_utilization: float = 0.85,
+                 max_drop_rate: float = 0.1, upgrade_after: int = 3, max_upgrade_after: int = 48):
+        self.send_config = send_config
+        self.ladder = ladder
+        self.level = level
+        self.interval = interval
+        self.min_rate = min_rate
+        self.max_utilization = max_utilization
+        self.max_drop_rate = max_drop_rate
+        self.base_upgrade_after = upgrade_after
+        self.upgrade_after = upgrade_after
+        self.max_upgrade_after = max_upgrade_after
+        self.healthy = 0
+        self.just_upgraded = False
+        self.changes = 0
+        self.last_metrics = {}
+        self.max_frame_size: Optional[int] = None
+        # Frames can be recorded (from any thread) before start(); the first window opens there
+        self._lock = threading.Lock()
+        self._reset_window()
+        self.window_start: Optional[float] = None
+
+    @property
+    def settings(self) -> StreamSettings:
+        return self.ladder[self.level]
+
+    def _reset_window(self) -> None:
+        self.window_start = time.perf_counter()
+        self.frames = 0
+        self.bytes = 0
+        self.busy: Dict[str, float] = {}
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Send the starting settings, since the firmware boots with its own defaults."""
+        self.send_config(self.settings)
+        with self._lock:
+            self._reset_window()
+
+    def record_frame(self, nbytes: int) -> None:
+        with self._lock:
+            self.frames += 1
+            self.bytes += nbytes
+
+    def record_processing(self, elapsed: float, stage: str = "receive") -> None:
+        """Time a host stage (one thread, e.g. "receive" or "process") spent on one frame."""
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + elapsed
+
+    def record_dropped(self, count: int = 1) -> None:
+        """Frames received but skipped because processing was still busy."""
+        with self._lock:
+            self.dropped += count
+
+    def _top_level(self) -> int:
+        """Highest ladder level within the camera's largest frame size."""
+        if self.max_frame_size is None:
+            return len(self.ladder) - 1
+        fits = [i for i, settings in enumerate(self.ladder) if settings.frame_size <= self.max_frame_size]
+        return fits[-1] if fits else 0
+
+    def set_max_frame_size(self, max_frame_size: int) -> None:
+        """Cap the ladder at the largest frame size the camera supports, stepping down if needed."""
+        if max_frame_size == self.max_frame_size:
+            return
+        self.max_frame_size = max_frame_size
+        top = self._top_level()
+        if self.level > top:
+            self.level = top
+            self.changes += 1
+            self.send_config(self.settings)
+            print(f"Stream settings -> {self.settings.describe()} (camera supports up to "
+                  f"{'x'.join(map(str, FRAME_SIZES[max_frame_size]))})")
+
+    def update(self) -> Optional[StreamSettings]:
+        """Evaluate the window if it is complete; returns the new settings if they changed."""
+        with self._lock:
+            if self.window_start is None:
+                return None
+            elapsed = time.perf_counter() - self.window_start
+            if elapsed < self.interval:
+                return None
+            frames, nbytes, busy, dropped = self.frames, self.bytes, self.busy, self.dropped
+            self._reset_window()
+        target_fps = 1000 / max(self.settings.interval_ms, 1)
+        fps = frames / elapsed
+        bottleneck = max(busy, key=busy.get) if busy else None
+        utilization = busy[bottleneck] / elapsed if busy else 0.0
+        drop_rate = dropped / frames if frames else 0.0
+        link_limited = fps < self.min_rate * target_fps
+        host_limited = utilization > self.max_utilization or drop_rate > self.max_drop_rate
+        self.last_metrics = {"fps": fps, "target_fps": target_fps, "kib_per_s": nbytes / elapsed / 1024,
+                             "utilization": utilization, "bottleneck": bottleneck, "drop_rate": drop_rate}
+
+        level = self.level
+        if link_limited or host_limited:
+            if self.just_upgraded:
+                self.upgrade_after = min(2 * self.upgrade_after, self.max_upgrade_after)
+            level = max(self.level - 1, 0)
+            self.healthy = 0
+        else:
+            self.healthy += 1
+            if self.just_upgraded:
+                # The new level held up for a whole window
+                self.upgrade_after = self.base_upgrade_after
+            if self.healthy >= self.upgrade_after and self.level < self._top_level():
+                level = self.level + 1
+                self.healthy = 0
+        self.just_upgraded = level > self.level
+        if level == self.level:
+            return None
+
+        reason = "link" if link_limited else "host" if host_limited else "headroom"
+        self.level = level
+        self.changes += 1
+        self.send_config(self.settings)
+        print(f"Stream settings -> {self.settings.describe()} ({reason}: {fps:.1f}/{target_fps:.1f} fps, "
+              f"{100 * utilization:.0f}% busy ({bottleneck}), {100 * drop_rate:.0f}% dropped)")
+        return self.settings
+
+
+def send_stream_config(sock, settings: StreamSettings, encoder: Optional[BinaryCommandEncoder] = None) -> None:
+    """Send camera stream settings as "CFG:<frame size>,<quality>,<interval ms>\n", or a binary frame if an encoder is given."""
+    if encoder is None:
+        command = encode_text_config(*settings)
+    else:
+        command = encoder.encode_config(*settings)
+    try:
+        sock.sendall(command)
+    except Exception as e:
+        print(f"Error sending stream settings over socket: {e}")
+
+def receive_images(sock, report_interval: float = 5.0, receiver: Optional[FrameReceiver] = None,
+                   sink: Optional[DisplaySink] = None, adapter: Optional[AdaptiveStreamController] = None,
+                   process_frame: Optional[Callable[[JpegFrame], object]] = None, reduction: int = 2):
+    """
+    Continuously receive JPEG frames from the ESP32 and display them.
+    Frames go to sink (a HighGUI window closed with ESC by default).
+    With an adapter, the time spent on each frame and the frames dropped feed its stream settings decisions.
+    process_frame, e.g. a function that runs analyze_jpeg(frame, tracker=tracker) and submits
+    the controller's command with scheduler.submit(a1, a2, result.captured), gets frames as a
+    JpegFrame: tracking runs on its 1/reduction size decode, and the full-size decode only happens
+    if the sink is active or process_frame reads the full image (e.g. the warped view).
+    It runs on its own thread behind a "latest frame wins" queue, so while it is busy newer frames
+    replace the waiting one instead of stalling the link.
+    """
+    receiver = receiver or FrameReceiver(sock)
+    if adapter is not None:
+        receiver.on_config_ack = adapter.set_max_frame_size
+    # Press ESC in the image window to quit
+    sink = sink or WindowSink(quit_keys=(27,))
+    last_report = time.perf_counter()
+    stop = threading.Event()
+    frames = None
+    if process_frame is not None:
+        def process(jpeg):
+            start = time.perf_counter()
+            try:
+                process_frame(jpeg)
+            finally:
+                if adapter is not None:
+                    adapter.record_processing(time.perf_counter() - start, "process")
+
+        frames = LatestQueue(on_drop=adapter.record_dropped if adapter is not None else None)
+        Stage("process_frame", process, frames, [], stop).start()
     while True:
-        # First, receive the 4-byte frame size.
-        size_data = recvall(sock, 4)
-        if not size_data:
-            print("Failed to receive frame size. Exiting image receiver.")
-            break
-        frame_size = struct.unpack("<I", size_data)[0]
-        
-        # Then, receive the actual JPEG frame data.
-        frame_data = recvall(sock, frame_size)
-        if not frame_data:
-            print("Failed to receive frame data. Exiting image receiver.")
+        frame = receiver.read_frame()
+        if frame is None:
+            print("Connection closed. Exiting image receiver.")
             break
 
-        # Decode the JPEG data to an image.
-        np_arr = np.frombuffer(frame_data, np.uint8)
-        img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        if img is not None:
-            cv2.imshow("ESP32 Camera Stream", img)
-            # Press ESC in the image window to quit
-            if cv2.waitKey(1) == 27:
-                break
+        start = time.perf_counter()
+        if frames is not None:
+            # Copied out of the receive buffer, which the next read_frame overwrites: results keep
+            # a reference to the frame and may decode it lazily long after this iteration
+            jpeg = JpegFrame(bytes(frame), reduction, receiver.last_frame_time)
+            frames.put(jpeg)
         else:
-            print("Failed to decode image.")
+            # Only the sink below reads it, before the next read_frame
+            jpeg = JpegFrame(frame, reduction, receiver.last_frame_time)
+        keep_going = True
+        if sink.active:
+            if jpeg.full is not None:
+                keep_going = sink.show("ESP32 Camera Stream", jpeg.full)
+            else:
+                print("Failed to decode image.")
+        if adapter is not None:
+            adapter.record_frame(len(frame))
+            adapter.record_processing(time.perf_counter() - start, "receive")
+            adapter.update()
+        if not keep_going:
+            break
 
+        if time.perf_counter() - last_report >= report_interval:
+            bps, fps = receiver.rates()
+            print(f"Receiving {bps / 1024:.1f} KiB/s, {fps:.1f} fps")
+            receiver.reset_rates()
+            last_report = time.perf_counter()
+
+    stop.set()
     sock.close()
-    cv2.destroyAllWindows()
+    sink.close()
 
-def send_servo_command(sock, angle1: int, angle2: int) -> None:
+def request_binary_mode(sock) -> None:
+    """
+    Ask the ESP32 to switch to binary servo commands. The switch is confirmed by an ack
+    which FrameReceiver reports through its binary_confirmed event.
+    """
+    sock.sendall(MODE_BINARY)
+
+def send_servo_command(sock, angle1: int, angle2: int, verbose: bool = True,
+                       encoder: Optional[BinaryCommandEncoder] = None) -> None:
     """
     Sends a servo command over WiFi via the socket.
-    Command format: "CMD:<angle1>,<angle2>\n"
+    Command format: "CMD:<angle1>,<angle2>\n", or a binary frame if an encoder is given
+    (only after the binary mode was confirmed, see request_binary_mode).
+    Pass verbose=False from hot loops (e.g. a ServoCommandScheduler) to skip the debug print.
+    Socket errors propagate, so a ServoCommandScheduler can count them and back off;
+    the scheduler also records glass-to-servo latency for commands submitted with a capture time.
     """
-    command = f"CMD:{angle1},{angle2}\n"
-    try:
-        sock.sendall(command.encode("utf-8"))
-        print(f"DEBUG: Sent command over socket: {command.strip()}")
-    except Exception as e:
-        print(f"Error sending command over socket: {e}")
+    command = encode_text_command(angle1, angle2) if encoder is None else encoder.encode(angle1, angle2)
+    with INSTRUMENTS.timer("send"):
+        sock.sendall(command)
+    if verbose:
+        print(f"DEBUG: Sent command over socket: {angle1},{angle2}")
 
-def send_servo_commands(sock):
+def send_servo_commands(scheduler: ServoCommandScheduler):
     """
-    Interactive mode: Read user input and send servo commands using send_servo_command.
+    Interactive mode: Read user input and submit servo commands to the scheduler, which sends them.
     """
     print("Enter servo commands as two angles separated by a comma (e.g., 90,45).")
     print("Type 'q' to quit.")
@@ -93,22 +415,48 @@ def send_servo_commands(sock):
             print("Invalid numbers. Please enter integer values.")
             continue
 
-        send_servo_command(sock, angle1, angle2)
+        scheduler.submit(angle1, angle2)
 
-def main():
-    # Initialize the socket connection to the ESP32.
-    sock = init_socket(ESP32_IP, ESP32_PORT)
+def main(binary: bool = False, ip: str = ESP32_IP, port: int = ESP32_PORT, adaptive: bool = False):
+    # Initialize the socket connection to the ESP32 (or simulator.py, e.g. ip="127.0.0.1").
+    sock = init_socket(ip, port)
     if sock is None:
         print("Exiting.")
         return
 
+    # Optionally let the host pick camera resolution, quality and frame rate.
+    # Settings go out as binary frames once binary mode is confirmed below.
+    encoder = None
+    adapter = None
+    if adaptive:
+        adapter = AdaptiveStreamController(lambda settings: send_stream_config(sock, settings, encoder))
+
     # Start a thread to receive and display images.
-    image_thread = threading.Thread(target=receive_images, args=(sock,), daemon=True)
+    receiver = FrameReceiver(sock)
+    image_thread = threading.Thread(target=receive_images, args=(sock,),
+                                    kwargs={"receiver": receiver, "adapter": adapter}, daemon=True)
     image_thread.start()
 
-    # In the main thread, handle sending servo commands.
-    send_servo_commands(sock)
+    # Optionally switch to the compact binary command protocol
+    if binary:
+        request_binary_mode(sock)
+        if receiver.binary_confirmed.wait(2.0):
+            encoder = BinaryCommandEncoder(ack=True)
+            receiver.encoder = encoder
+            print("Using binary servo commands.")
+        else:
+            print("ESP32 did not confirm binary mode, using text commands.")
+    if adapter is not None:
+        adapter.start()
+
+    # In the main thread, read servo commands; the scheduler sends them (with the
+    # binary encoder once confirmed) and backs off while the socket is failing.
+    scheduler = ServoCommandScheduler(lambda a1, a2: send_servo_command(sock, a1, a2, encoder=encoder),
+                                      relative=False)
+    with scheduler:
+        send_servo_commands(scheduler)
 
+    print(INSTRUMENTS.format_summary())
     print("Closing connection and exiting.")
     sock.close()
 
@@ -16,6 +16,30 @@ const int servoPin2 = 15; // Using GPIO15 for the second servo
 int currentServoAngle1 = 30;
 int currentServoAngle2 = 120;
 
+// Binary command protocol (see app/protocol.py), enabled per connection by "MODE:BIN"
+// Frame: magic 0xA5, flags, angle1 (int16 LE), angle2 (int16 LE), seq, XOR checksum
+const uint8_t CMD_MAGIC = 0xA5;
+const uint8_t CMD_FLAG_ACK = 0x01;
+const size_t CMD_FRAME_SIZE = 8;
+// Acks are a 4-byte header that can never be a frame size: 0xA6 | payload | status | seq
+// ACK_CONFIG acks carry maxFrameSize as payload, so the host knows which sizes it may ask for
+const uint8_t ACK_MARKER = 0xA6;
+const uint8_t ACK_OK = 0x00;
+const uint8_t ACK_BAD_CHECKSUM = 0x01;
+const uint8_t ACK_MODE_BINARY = 0x02;
+const uint8_t ACK_CONFIG = 0x03;
+bool binaryMode = false;
+
+// Stream settings sent by the host ("CFG:<frame size>,<quality>,<interval ms>" or a binary frame
+// with magic 0xA7, see app/protocol.py). Frame sizes are indices into this table, which must
+// match FRAME_SIZES in app/protocol.py.
+const uint8_t CFG_MAGIC = 0xA7;
+const framesize_t FRAME_SIZES[] = {FRAMESIZE_QQVGA, FRAMESIZE_QVGA, FRAMESIZE_CIF, FRAMESIZE_VGA, FRAMESIZE_SVGA};
+const int FRAME_SIZE_COUNT = sizeof(FRAME_SIZES) / sizeof(FRAME_SIZES[0]);
+int maxFrameSize = 1;                  // Largest index the frame buffers were allocated for
+unsigned long frameIntervalMs = 1000;  // Minimum time between frames
+unsigned long lastFrameMs = 0;
+
 // Print the Bluetooth MAC address for reference
 void printBTMacAddress() {
   uint8_t btMac[6];
@@ -67,19 +91,127 @@ camera_config_t camera_config = {
 
 // Initialize the camera
 void initCamera() {
+  // With PSRAM, allocate frame buffers for the largest size the host may ask for and keep a
+  // second buffer so capture overlaps sending; start streaming at QVGA either way.
+  if (psramFound()) {
+    camera_config.frame_size = FRAME_SIZES[FRAME_SIZE_COUNT - 1];
+    camera_config.fb_count = 2;
+    camera_config.fb_location = CAMERA_FB_IN_PSRAM;
+    camera_config.grab_mode = CAMERA_GRAB_LATEST;
+    maxFrameSize = FRAME_SIZE_COUNT - 1;
+  }
   esp_err_t err = esp_camera_init(&camera_config);
   if (err != ESP_OK) {
     Serial.printf("Camera init failed with error 0x%x", err);
     while (true) { delay(1000); } // Halt if camera initialization fails
   }
+  sensor_t *sensor = esp_camera_sensor_get();
+  sensor->set_framesize(sensor, FRAMESIZE_QVGA);
+}
+
+// Apply stream settings from the host, clamped to what the frame buffers allow
+void applyStreamConfig(int frameSize, int quality, int intervalMs) {
+  frameSize = constrain(frameSize, 0, maxFrameSize);
+  quality = constrain(quality, 4, 63);
+  frameIntervalMs = constrain(intervalMs, 0, 5000);
+  sensor_t *sensor = esp_camera_sensor_get();
+  sensor->set_framesize(sensor, FRAME_SIZES[frameSize]);
+  sensor->set_quality(sensor, quality);
+  Serial.printf("Stream settings: frame size %d, quality %d, interval %lu ms\n", frameSize, quality, frameIntervalMs);
+}
+
+// Set both servos, constraining the angles between 0 and 180 degrees
+void setServos(int angle1, int angle2) {
+  angle1 = constrain(angle1, 0, 180);
+  angle2 = constrain(angle2, 0, 180);
+  servoGPIO14.write(angle1);
+  servoGPIO15.write(angle2);
+  currentServoAngle1 = angle1;
+  currentServoAngle2 = angle2;
+}
+
+// Send a compact ack in the frame stream (written little endian like the frame size header)
+void sendAck(uint8_t seq, uint8_t status, uint8_t payload = 0) {
+  uint32_t ack = ((uint32_t)ACK_MARKER << 24) | ((uint32_t)payload << 16) | ((uint32_t)status << 8) | seq;
+  SerialBT.write((uint8_t*)&ack, sizeof(ack));
+}
+
+// Process fixed-size binary commands, without String allocations or a text echo
+void processBinaryCommands() {
+  while (SerialBT.available() >= (int)CMD_FRAME_SIZE) {
+    // Resynchronise on the magic byte
+    int magic = SerialBT.peek();
+    if (magic != CMD_MAGIC && magic != CFG_MAGIC) {
+      SerialBT.read();
+      continue;
+    }
+    uint8_t frame[CMD_FRAME_SIZE];
+    SerialBT.readBytes(frame, CMD_FRAME_SIZE);
+
+    uint8_t sum = 0;
+    for (size_t i = 0; i < CMD_FRAME_SIZE - 1; i++) {
+      sum ^= frame[i];
+    }
+    uint8_t flags = frame[1];
+    uint8_t seq = frame[6];
+    if (sum != frame[7]) {
+      if (flags & CMD_FLAG_ACK) {
+        sendAck(seq, ACK_BAD_CHECKSUM);
+      }
+      continue;
+    }
+
+    if (magic == CFG_MAGIC) {
+      applyStreamConfig(frame[2], frame[3], frame[4] | (frame[5] << 8));
+      if (flags & CMD_FLAG_ACK) {
+        sendAck(seq, ACK_CONFIG, maxFrameSize);
+      }
+      continue;
+    }
+
+    int16_t angle1 = (int16_t)(frame[2] | (frame[3] << 8));
+    int16_t angle2 = (int16_t)(frame[4] | (frame[5] << 8));
+    setServos(angle1, angle2);
+    if (flags & CMD_FLAG_ACK) {
+      sendAck(seq, ACK_OK);
+    }
+  }
 }
 
 // Process incoming Bluetooth commands
 // Expected command format: "CMD:<angle1>,<angle2>" e.g., "CMD:90,45"
+// "MODE:BIN" switches to binary commands until the client disconnects
 void processCommands() {
+  if (binaryMode) {
+    processBinaryCommands();
+    return;
+  }
   if (SerialBT.available()) {
     String command = SerialBT.readStringUntil('\n');
     command.trim();
+
+    if (command == "MODE:BIN") {
+      binaryMode = true;
+      sendAck(0, ACK_MODE_BINARY);
+      Serial.println("Switched to binary servo commands");
+      return;
+    }
+
+    // "CFG:<frame size>,<quality>,<interval ms>"
+    if (command.startsWith("CFG:")) {
+      int first = command.indexOf(',');
+      int second = command.indexOf(',', first + 1);
+      if (first == -1 || second == -1) {
+        Serial.print("Invalid config format: ");
+        Serial.println(command);
+        return;
+      }
+      applyStreamConfig(command.substring(4, first).toInt(),
+                        command.substring(first + 1, second).toInt(),
+                        command.substring(second + 1).toInt());
+      sendAck(0, ACK_CONFIG, maxFrameSize);
+      return;
+    }
     
     // Only process commands that start with "CMD:"
     if (!command.startsWith("CMD:")) {
@@ -105,16 +237,10 @@ void processCommands() {
     int angle1 = angle1Str.toInt();
     int angle2 = angle2Str.toInt();
     
-    // Constrain angles between 0 and 180 degrees
-    angle1 = constrain(angle1, 0, 180);
-    angle2 = constrain(angle2, 0, 180);
-    
     // Set the servos to the received angles
-    servoGPIO14.write(angle1);
-    servoGPIO15.write(angle2);
-    
-    currentServoAngle1 = angle1;
-    currentServoAngle2 = angle2;
+    setServos(angle1, angle2);
+    angle1 = currentServoAngle1;
+    angle2 = currentServoAngle2;
     
     Serial.print("Servo on GPIO14 set to ");
     Serial.print(angle1);
@@ -159,6 +285,7 @@ void setup() {
 void loop() {
   // Only attempt to send if a Bluetooth client is connected
   if (!SerialBT.hasClient()) {
+    binaryMode = false;
     Serial.println("No Bluetooth client connected. Waiting...");
     delay(500);
     return;
@@ -167,6 +294,13 @@ void loop() {
   // Process any incoming commands first
   processCommands();
 
+  // Pace frames at the interval requested by the host, handling commands in between
+  if (millis() - lastFrameMs < frameIntervalMs) {
+    delay(1);
+    return;
+  }
+  lastFrameMs = millis();
+
   // Capture a frame from the camera
   camera_fb_t *fb = esp_camera_fb_get();
   if (!fb) {
@@ -183,6 +317,4 @@ void loop() {
   SerialBT.write(fb->buf, frameSize);
   
   esp_camera_fb_return(fb);
-
-  delay(1000); // Delay to allow client time to process frame
 }